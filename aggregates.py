@@ -0,0 +1,50 @@
+import dataclasses
+import numpy as np
+
+
+# Breakdowns and ratios of the total stats used by the charts
+# Computed once per dataset version (see dataset.publish), so the chart
+# builders only format them. Arrays follow the order of ages and genders.
+@dataclasses.dataclass(frozen=True)
+class Aggregates:
+    categories: tuple
+    ages: tuple
+    age_labels: tuple
+    genders: tuple
+    # Category -> values by gender / by age / by age x gender
+    by_gender: dict
+    by_age: dict
+    by_age_and_gender: dict
+    # Fatality (deceased / cases) in percent
+    fatality_by_gender: np.ndarray
+    fatality_by_age: np.ndarray
+    fatality_by_age_and_gender: np.ndarray
+
+
+# Age label (e.g. 0_17 -> 0 to 17, 65plus -> 65+)
+def age_label(age):
+    return age.replace('_', ' to ').replace('plus', '+')
+
+
+def _readonly(values):
+    values = np.asarray(values)
+    values.flags.writeable = False
+    return values
+
+
+# Compute the aggregates from the total stats cube
+def compute_aggregates(cube):
+    age_labels = tuple(age_label(age) for age in cube.ages)
+
+    return Aggregates(
+        categories=cube.categories,
+        ages=cube.ages,
+        age_labels=age_labels,
+        genders=cube.genders,
+        by_gender={cat: _readonly(cube.by_gender(cat)) for cat in cube.categories},
+        by_age={cat: _readonly(cube.by_age(cat)) for cat in cube.categories},
+        by_age_and_gender={cat: cube.category(cat) for cat in cube.categories},
+        fatality_by_gender=_readonly(cube.fatality(by='gender')),
+        fatality_by_age=_readonly(cube.fatality(by='age')),
+        fatality_by_age_and_gender=_readonly(cube.fatality())
+    )
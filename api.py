@@ -0,0 +1,283 @@
+import base64
+import gzip
+import hashlib
+import json
+import os
+import brotli
+import flask
+import numpy as np
+import dataset
+import httpcache
+import lru
+
+
+# Read-only data API: /api/v1/daily, /api/v1/totals and /api/v1/rolling
+#
+# Parameters:
+#   from, to: first and last date (YYYY-MM-DD, daily and rolling only)
+#   fields: comma separated fields (default: all)
+#   window: days of the rolling averages (rolling only, default: 7)
+#   format: json (default) or csv
+#   limit: rows per page (default and maximum: API_PAGE_SIZE)
+#   cursor: next page cursor (the next_cursor of the previous page, also in
+#       the Link header), stable across dataset versions
+#
+# The cells of each resource are encoded once per dataset version (JSON and
+# CSV), and responses are built by joining the encoded cells of the requested
+# rows and fields, without pandas serialization. Responses are cached with
+# their gzip and brotli encodings, keyed by (dataset version, resource,
+# format, fields, row range) in least recently used order up to
+# API_CACHE_BYTES bytes (see lru), so a repeated request is served from memory. The
+# first page of every resource is encoded after each new dataset (prewarm).
+
+PREFIX = '/api/v1/'
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 1000))
+API_CACHE_BYTES = int(os.environ.get('API_CACHE_BYTES', 16 * 1024 * 1024))
+API_BROTLI_QUALITY = int(os.environ.get('API_BROTLI_QUALITY', 5))
+
+# Rolling average windows of the API (the trailing windows calculated for each dataset)
+ROLLING_WINDOWS = [window for window, center in dataset.ROLLING_WINDOWS if not center]
+
+FORMATS = {
+    'json': 'application/json',
+    'csv': 'text/csv; charset=utf-8'
+}
+
+
+# Resource name -> (function returning the frame of a dataset, dated)
+# Rows of dated frames are sorted by their date column, which is their key
+# (filters and cursors); rows of the others are keyed by position.
+RESOURCES = {
+    'daily': (lambda ds, window: ds.daily_stats, True),
+    'totals': (lambda ds, window: ds.total_stats.rename_axis('name').reset_index(), False),
+    'rolling': (lambda ds, window: ds.rolling_stats(window), True),
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+# Encoded cells of a resource for one dataset version
+class Table:
+    def __init__(self, df, dated):
+        self.fields = list(df.columns)
+        self.rows = len(df)
+        self.dates = df['date'].to_numpy().astype('M8[D]') if dated else None
+        # Cells of each field after their separator (and key): b',"name":value' and b',value'
+        self.json = {
+            name: np.char.add(f',{json.dumps(name)}:'.encode(), _encode_json(df[name].to_numpy())).tolist()
+            for name in self.fields
+        }
+        self.csv = {name: np.char.add(b',', _encode_csv(df[name].to_numpy())).tolist() for name in self.fields}
+
+    # Key of a row (date, or position), as a cursor
+    def cursor(self, row):
+        key = str(self.dates[row]) if self.dates is not None else str(row)
+        return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+    # Row of a cursor (first row with a key at or after it)
+    def cursor_row(self, cursor):
+        try:
+            key = base64.b64decode(cursor + '=' * (-len(cursor) % 4), altchars=b'-_', validate=True).decode()
+            if not key:
+                raise ValueError(cursor)
+            if self.dates is not None:
+                return int(np.searchsorted(self.dates, np.datetime64(key, 'D')))
+            return int(key)
+        except ValueError:
+            raise BadRequest('Invalid cursor')
+
+    # Rows first..last of the dates start..end (inclusive, None: unbounded)
+    def date_range(self, start, end):
+        first = 0 if start is None else int(np.searchsorted(self.dates, start, side='left'))
+        last = self.rows if end is None else int(np.searchsorted(self.dates, end, side='right'))
+        return first, last
+
+
+def _encode_json(values):
+    if values.dtype.kind in 'iub':
+        return values.astype(str).astype('S')
+    if values.dtype.kind == 'f':
+        cells = values.astype(str).astype('S')
+        cells[~np.isfinite(values)] = b'null'
+        return cells
+    return np.array([json.dumps(value, ensure_ascii=False).encode() for value in values.astype(str)], dtype='S')
+
+
+def _encode_csv(values):
+    if values.dtype.kind in 'iub':
+        return values.astype(str).astype('S')
+    if values.dtype.kind == 'f':
+        cells = values.astype(str).astype('S')
+        cells[~np.isfinite(values)] = b''
+        return cells
+    return np.array([
+        ('"' + value.replace('"', '""') + '"' if any(c in value for c in ',"\n') else value).encode()
+        for value in values.astype(str)
+    ], dtype='S')
+
+
+# Encoded rows first..last: the cells of the fields, without the first separator
+def _join_rows(cells, fields, first, last):
+    return [row[1:] for row in map(b''.join, zip(*[cells[name][first:last] for name in fields]))]
+
+
+# Body of a page (rows first..last, fields) in a format
+def encode(table, format, fields, first, last, next_cursor, version):
+    rows = _join_rows(table.csv if format == 'csv' else table.json, fields, first, last)
+    if format == 'csv':
+        return b'\n'.join([','.join(fields).encode(), *rows]) + b'\n'
+
+    return (
+        b'{"version":' + str(version).encode() +
+        b',"fields":' + json.dumps(fields, separators=(',', ':')).encode() +
+        b',"next_cursor":' + json.dumps(next_cursor).encode() +
+        b',"data":[' + (b'{' + b'},{'.join(rows) + b'}' if rows else b'') + b']}'
+    )
+
+
+# Encoded response: body in every content encoding, and its ETag
+class Response:
+    def __init__(self, body, next_cursor):
+        self.next_cursor = next_cursor
+        self.bodies = {
+            None: body,
+            'br': brotli.compress(body, quality=API_BROTLI_QUALITY),
+            'gzip': gzip.compress(body, compresslevel=6, mtime=0)
+        }
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.size = sum(map(len, self.bodies.values()))
+
+
+_tables = {}
+_cache = lru.BoundedLRU(API_CACHE_BYTES, size=lambda response: response.size)
+
+stats = dict(
+    prewarms=0
+)
+
+
+# Encoded cells of a resource for a dataset (encoded once per version)
+def get_table(resource, ds, window=None):
+    key = (ds.version, resource, window)
+    table = _tables.get(key)
+    if table is None:
+        get_frame, dated = RESOURCES[resource]
+        table = _tables[key] = Table(get_frame(ds, window), dated)
+    return table
+
+
+def _parse_date(value, name):
+    if value is None:
+        return None
+    try:
+        return np.datetime64(value, 'D')
+    except ValueError:
+        raise BadRequest(f'Invalid {name} date: {value}')
+
+
+# Response to a request (dict of parameters) for a resource of a dataset (default: current dataset)
+def get_response(resource, args, ds=None):
+    ds = ds or dataset.current()
+
+    window = None
+    if resource == 'rolling':
+        window = args.get('window', str(ROLLING_WINDOWS[-1]))
+        if window not in map(str, ROLLING_WINDOWS):
+            raise BadRequest(f'Invalid window, one of: {", ".join(map(str, ROLLING_WINDOWS))}')
+        window = int(window)
+
+    format = args.get('format', 'json')
+    if format not in FORMATS:
+        raise BadRequest(f'Invalid format, one of: {", ".join(FORMATS)}')
+
+    try:
+        limit = int(args.get('limit', API_PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if not 0 < limit <= API_PAGE_SIZE:
+        raise BadRequest(f'Invalid limit, 1 to {API_PAGE_SIZE}')
+
+    table = get_table(resource, ds, window)
+
+    fields = table.fields
+    if args.get('fields'):
+        requested = args['fields'].split(',')
+        unknown = [name for name in requested if name not in table.fields]
+        if unknown:
+            raise BadRequest(f'Unknown fields: {", ".join(unknown)}')
+        fields = [name for name in table.fields if name in requested]
+
+    if table.dates is not None:
+        first, last = table.date_range(_parse_date(args.get('from'), 'from'), _parse_date(args.get('to'), 'to'))
+    elif args.get('from') or args.get('to'):
+        raise BadRequest(f'{resource} has no dates')
+    else:
+        first, last = 0, table.rows
+
+    if args.get('cursor'):
+        first = max(first, table.cursor_row(args['cursor']))
+    end = max(first, min(first + limit, last))
+    next_cursor = table.cursor(end) if end < last else None
+
+    key = (ds.version, resource, window, format, tuple(fields), first, end, next_cursor)
+    return _cache.get_or_build(
+        key,
+        lambda: Response(encode(table, format, fields, first, end, next_cursor, ds.version), next_cursor)
+    )
+
+
+# Remove the encodings and responses of all other dataset versions
+def discard_other_versions(version):
+    for key in [key for key in list(_tables) if key[0] != version]:
+        _tables.pop(key, None)
+    _cache.discard_other_versions(version)
+
+
+# Encode the first page of every resource of a dataset (default: current dataset), in every format
+def prewarm(ds=None):
+    ds = ds or dataset.current()
+    discard_other_versions(ds.version)
+
+    for resource in RESOURCES:
+        for window in (ROLLING_WINDOWS if resource == 'rolling' else [None]):
+            for format in FORMATS:
+                args = dict(format=format, window=str(window)) if window else dict(format=format)
+                get_response(resource, args, ds)
+
+    stats['prewarms'] += 1
+
+
+# Cache statistics
+def cache_stats():
+    return dict(_cache.cache_stats(), **stats)
+
+
+def _serve(resource):
+    try:
+        response = get_response(resource, flask.request.args)
+    except BadRequest as err:
+        return flask.Response(json.dumps(dict(error=str(err))), status=400, mimetype='application/json')
+
+    if flask.request.if_none_match.contains_weak(response.etag):
+        result = flask.Response(status=304)
+    else:
+        encoding = next((name for name in ('br', 'gzip') if flask.request.accept_encodings[name]), None)
+        result = flask.Response(response.bodies[encoding], content_type=FORMATS[flask.request.args.get('format', 'json')])
+        if encoding is not None:
+            result.headers['Content-Encoding'] = encoding
+
+    result.set_etag(response.etag, weak=True)
+    result.headers['Vary'] = 'Accept-Encoding'
+    result.headers['Cache-Control'] = f'public, max-age={httpcache.HTTP_CACHE_MAX_AGE}'
+    if response.next_cursor is not None:
+        args = dict(flask.request.args, cursor=response.next_cursor)
+        result.headers['Link'] = f'<{flask.url_for(flask.request.endpoint, _external=True, **args)}>; rel="next"'
+    return result
+
+
+# Add the API endpoints (PREFIX + resource) to a Flask server
+def init_app(server):
+    for resource in RESOURCES:
+        server.add_url_rule(PREFIX + resource, f'api_{resource}', lambda resource=resource: _serve(resource))
@@ -1,11 +1,29 @@
-from dash import Dash, html, dcc, Input, Output, State
+import time
+_import_started = time.perf_counter()
+
+from dash import Dash, html, dcc, Input, Output, State, callback_context
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
+import figcache
+import figjson
 import graphs
-import data
+import dataset
 import cards
+import refresh
+import httpcache
+import metrics
+import data
+import breaker
+import api
+import bundle
 from flask_caching import Cache
+from plotly.io.json import to_json_plotly
+import flask
 import datetime
+import json
 import os
+import re
+import zlib
 
 
 meta_tags = [
@@ -29,9 +47,13 @@ meta_tags = [
 ]
 
 
-app = Dash(__name__,  assets_ignore='.*ignored.*', meta_tags=meta_tags)
+# Purged, fingerprinted and pre-compressed stylesheets and fonts instead of the raw assets (see bundle)
+asset_bundle = bundle.load()
+
+app = Dash(__name__, meta_tags=meta_tags, **bundle.dash_options(asset_bundle, assets_ignore='.*ignored.*'))
 app.title = "COVID 19 - GREECE ANALYTICS"
 server = app.server
+bundle.init_app(server, asset_bundle)
 
 cache = Cache(app.server, config={
     'CACHE_TYPE': os.environ.get('APP_CACHE_TYPE', 'FileSystemCache'),
@@ -39,6 +61,15 @@ cache = Cache(app.server, config={
     'CACHE_REDIS_URL': os.environ.get('REDIS_URL', '')
 })
 
+# Switch between the variants of the radio-button charts in the browser
+# All variants of the current data are sent once with the layout (in dcc.Store
+# components), so toggling a chart needs no request to the server.
+CLIENTSIDE_SWITCHING = os.environ.get('CLIENTSIDE_SWITCHING', '') not in ('', '0', 'false', 'False')
+
+# Radio button options
+LINE_OPTIONS = ['Daily', '3-day average', 'Weekly average', 'Running total']
+CATEGORY_OPTIONS = ['Cases', 'Deceased', 'Intubated']
+
 # App layout elements
 layout_navbar = dbc.Navbar(
     [
@@ -116,10 +147,131 @@ layout_modal = dbc.Modal(
 )
 
 
+# Stores with all variants of a chart by radio button value (only with clientside switching)
+def generate_figure_stores(store_id, fragments):
+    if not CLIENTSIDE_SWITCHING:
+        return []
+    return [dcc.Store(id=store_id, data=fragments[store_id])]
+
+
+# Info cards of the last day
+def generate_info_cards(last_day):
+    return [
+        dbc.Col(
+            cards.generate_info_card(
+                "Cases",
+                html.Div([
+                    f"{last_day['cases']:,} ",
+                    html.Span(
+                        f"{last_day['intubated']} INTUBATED",
+                        className="badge badge-pill badge-cases-critical text-xs"
+                    )
+                ]),
+                html.Div([
+                    f"Total: {last_day['total_cases']:,}",
+                ]),
+                "cases-total",
+                "fa-plus-square"
+            ),
+            # lg=3,
+            sm=6,
+            class_name="mb-4"
+        ),
+        dbc.Col(
+            cards.generate_info_card(
+                "Deaths",
+                html.Div([
+                    f"{last_day['deceased']:,}",
+                ]),
+                html.Div([
+                    f"Total: {last_day['total_deceased']:,}",
+                    html.Span(
+                        f" ({last_day['total_deceased']/last_day['total_cases'] * 100:.2f}%)",
+                        className="text-xs"
+                    ),
+                ]),
+                "cases-deceased",
+                "fa-skull-crossbones"
+            ),
+            # lg=3,
+            sm=6,
+            class_name="mb-4"
+        ),
+    ]
+
+
+# Layout fragments: the parts of the layout that depend on the data
+# Figures: fragment name -> (chart, input)
+LAYOUT_FIGURES = {
+    'figure-daily': ('daily', 'Daily'),
+    'figure-age-group': ('age-group', None),
+    'figure-gender-pie': ('gender-pie', 'cases'),
+    'figure-sunburst': ('sunburst', 'cases'),
+}
+
+# Figure stores (only with clientside switching): fragment name -> (chart, radio button options, input of an option)
+LAYOUT_FIGURE_STORES = {
+    'figures-daily': ('daily', LINE_OPTIONS, lambda value: value),
+    'figures-gender-pie': ('gender-pie', CATEGORY_OPTIONS, str.lower),
+    'figures-sunburst': ('sunburst', CATEGORY_OPTIONS, str.lower),
+} if CLIENTSIDE_SWITCHING else {}
+
+LAYOUT_FRAGMENTS = ['last-updated', 'info-cards'] + list(LAYOUT_FIGURES) + list(LAYOUT_FIGURE_STORES)
+
+# Seconds the fragments of a dataset are kept in the cache
+LAYOUT_FRAGMENT_TIMEOUT = 24 * 60 * 60
+
+# Hash of the code and settings that affect the layout and callback responses
+CODE_VERSION = httpcache.code_version(CLIENTSIDE_SWITCHING, graphs.DAILY_CHART_POINTS, figjson.TYPED_ARRAYS)
+
+
+# Value of a layout fragment for a dataset (components or figure)
+def layout_fragment(name, ds):
+    return json.loads(layout_fragment_json(name, ds))
+
+
+# Serialized layout fragment (JSON) for a dataset
+def layout_fragment_json(name, ds):
+    if name in LAYOUT_FIGURES:
+        chart, input = LAYOUT_FIGURES[name]
+        return figcache.get_figure_json(chart, input, ds=ds)
+
+    if name in LAYOUT_FIGURE_STORES:
+        chart, options, to_input = LAYOUT_FIGURE_STORES[name]
+        return '{' + ','.join(
+            json.dumps(value) + ':' + figcache.get_figure_json(chart, to_input(value), ds=ds)
+            for value in options
+        ) + '}'
+
+    last_day = ds.daily_stats.iloc[-1].to_dict()
+    if name == 'last-updated':
+        return to_json_plotly(f"Last updated: ({last_day['date']})")
+    if name == 'info-cards':
+        return to_json_plotly(generate_info_cards(last_day))
+
+    raise KeyError(name)
+
+
+# Serialized layout fragment (JSON) for a dataset, from the cache
+# Fragments are cached by code version and dataset fingerprint (zlib
+# compressed), so worker processes with the same code and data share them,
+# and a deploy or a settings change does not serve the fragments of before.
+def cached_layout_fragment_json(name, ds):
+    key = f'layout-fragment/{CODE_VERSION}/{ds.fingerprint}/{name}'
+    value = cache.get(key)
+    if value is not None:
+        layout_stats['fragment_hits'] += 1
+        return zlib.decompress(value).decode()
+
+    layout_stats['fragment_misses'] += 1
+    fragment = layout_fragment_json(name, ds)
+    cache.set(key, zlib.compress(fragment.encode()), timeout=LAYOUT_FRAGMENT_TIMEOUT)
+    return fragment
+
+
 # App layout
-@cache.memoize(timeout=300)  # in seconds
-def create_layout():
-    data.load_new_data(save=True)
+# Static shell (navbar, grid, footer, modal) with the given fragments
+def layout_shell(fragments):
     return html.Div([
         layout_navbar,
 
@@ -129,55 +281,14 @@ def create_layout():
                     [
                         html.H2("Dashboard"),
                         html.Div(
-                            f"Last updated: ({data.df_daily_stats.iloc[-1]['date']})",
+                            fragments['last-updated'],
                             className="text-xs align-self-end mb-2"
                         )
                     ],
                     class_name="text-primary"
                 ),
                 dbc.Row(
-                        [
-                            dbc.Col(
-                                cards.generate_info_card(
-                                    "Cases",
-                                    html.Div([
-                                        f"{data.df_daily_stats.iloc[-1]['cases']:,} ",
-                                        html.Span(
-                                            f"{data.df_daily_stats.iloc[-1]['intubated']} INTUBATED",
-                                            className="badge badge-pill badge-cases-critical text-xs"
-                                        )
-                                    ]),
-                                    html.Div([
-                                        f"Total: {data.df_daily_stats.iloc[-1]['total_cases']:,}",
-                                    ]),
-                                    "cases-total",
-                                    "fa-plus-square"
-                                ),
-                                # lg=3,
-                                sm=6,
-                                class_name="mb-4"
-                            ),
-                            dbc.Col(
-                                cards.generate_info_card(
-                                    "Deaths",
-                                    html.Div([
-                                        f"{data.df_daily_stats.iloc[-1]['deceased']:,}",
-                                    ]),
-                                    html.Div([
-                                        f"Total: {data.df_daily_stats.iloc[-1]['total_deceased']:,}",
-                                        html.Span(
-                                            f" ({data.df_daily_stats.iloc[-1]['total_deceased']/data.df_daily_stats.iloc[-1]['total_cases'] * 100:.2f}%)",
-                                            className="text-xs"
-                                        ),
-                                    ]),
-                                    "cases-deceased",
-                                    "fa-skull-crossbones"
-                                ),
-                                # lg=3,
-                                sm=6,
-                                class_name="mb-4"
-                            ),
-                        ]
+                        fragments['info-cards']
                     ),
         
                     dbc.Row(
@@ -186,13 +297,14 @@ def create_layout():
                                     cards.generate_card(
                                         "Timeline",
                                         html.Div([
-                                            dcc.RadioItems(['Daily', '3-day average', 'Weekly average', 'Running total'], 'Daily', id='input-line'),
+                                            dcc.RadioItems(LINE_OPTIONS, 'Daily', id='input-line'),
                                             dcc.Graph(
                                                 id='graph-daily',
-                                                figure=graphs.daily_line_chart(),
+                                                figure=fragments['figure-daily'],
                                                 config = {'toImageButtonOptions': {'scale': 3}}
                                             )
-                                        ])
+                                        ] + generate_figure_stores('figures-daily', fragments)
+                                          + ([dcc.Store(id='figure-daily-window')] if CLIENTSIDE_SWITCHING else []))
                                     ),
                                     class_name="mb-4"
                                 ),
@@ -205,7 +317,7 @@ def create_layout():
                                         "Age groups",
                                         dcc.Graph(
                                             id='graph-age-group',
-                                            figure=graphs.age_group_bar_chart(),
+                                            figure=fragments['figure-age-group'],
                                             config={
                                                 'modeBarButtonsToRemove': ['select2d', 'lasso2d'],
                                                 'toImageButtonOptions': {'scale': 3}
@@ -222,13 +334,13 @@ def create_layout():
                                     cards.generate_card(
                                         "Info per gender",
                                         html.Div([
-                                            dcc.RadioItems(['Cases', 'Deceased', 'Intubated'], 'Cases', id='input-gender-pie'),
+                                            dcc.RadioItems(CATEGORY_OPTIONS, 'Cases', id='input-gender-pie'),
                                             dcc.Graph(
                                                 id='graph-info-by-gender',
-                                                figure=graphs.info_by_gender_pie_chart('cases'),
+                                                figure=fragments['figure-gender-pie'],
                                                 config = {'toImageButtonOptions': {'scale': 3}}
                                             )
-                                        ])
+                                        ] + generate_figure_stores('figures-gender-pie', fragments))
                                     ),
                                     md=6,
                                     class_name="mb-4"
@@ -237,13 +349,13 @@ def create_layout():
                                     cards.generate_card(
                                         "Info per age group and gender",
                                         html.Div([
-                                            dcc.RadioItems(['Cases', 'Deceased', 'Intubated'], 'Cases', id='input-sunburst'),
+                                            dcc.RadioItems(CATEGORY_OPTIONS, 'Cases', id='input-sunburst'),
                                             dcc.Graph(
                                                 id='graph-info-by-age-group-and-gender',
-                                                figure=graphs.info_by_age_group_and_gender_sunburst_chart('cases'),
+                                                figure=fragments['figure-sunburst'],
                                                 config = {'toImageButtonOptions': {'scale': 3}}
                                             )
-                                        ])
+                                        ] + generate_figure_stores('figures-sunburst', fragments))
                                     ),
                                     md=6,
                                     class_name="mb-4"
@@ -259,37 +371,196 @@ def create_layout():
         layout_modal,
     ])
 
+
+# Layout (component tree) of the current dataset
+# Used by Dash to validate the callbacks; page loads are served by serve_layout.
+def create_layout():
+    ds = dataset.current()
+    return layout_shell({name: layout_fragment(name, ds) for name in LAYOUT_FRAGMENTS})
+
+
+# Placeholder of a fragment in the serialized shell
+FRAGMENT_PLACEHOLDER = '__layout-fragment:{}__'
+
+# Shell with fragment placeholders (built once)
+# Also the validation layout of Dash: it has all the component ids, and Dash
+# does not build the figures of create_layout() at startup to validate them.
+_shell_layout = layout_shell({name: FRAGMENT_PLACEHOLDER.format(name) for name in LAYOUT_FRAGMENTS})
+
+# Serialized shell, split into [text, fragment name, text, ..., text]
+_shell_parts = re.split(r'"__layout-fragment:([\w-]+)__"', to_json_plotly(_shell_layout))
+
+# Last serialized layout: (dataset fingerprint, JSON)
+_layout_json = (None, None)
+
+layout_stats = dict(
+    hits=0,
+    misses=0,
+    fragment_hits=0,
+    fragment_misses=0
+)
+
+
+# Serialized layout (JSON) of the current dataset: the shell filled in with the fragments
+def layout_json():
+    global _layout_json
+
+    ds = dataset.current()
+    fingerprint, value = _layout_json
+    if fingerprint == ds.fingerprint:
+        layout_stats['hits'] += 1
+        return value
+
+    layout_stats['misses'] += 1
+    value = ''.join(
+        part if i % 2 == 0 else cached_layout_fragment_json(part, ds)
+        for i, part in enumerate(_shell_parts)
+    )
+    _layout_json = (ds.fingerprint, value)
+    return value
+
+
+# Serve the layout from layout_json, instead of serializing create_layout() on each page load
+def serve_layout():
+    return flask.Response(layout_json(), mimetype='application/json')
+
+
+# Load initial data and refresh data in the background, outside of the request path
+refresh.status['import_duration'] = time.perf_counter() - _import_started
+print(f'Modules imported in {refresh.status["import_duration"] * 1000:.1f} ms')
+refresh.startup()
+
+app.validation_layout = _shell_layout
 app.layout = create_layout
+server.view_functions[app.config.routes_pathname_prefix + '_dash-layout'] = serve_layout
+
+# Prometheus metrics on /metrics (before httpcache, so that 304 responses are timed too)
+_prefix = app.config.routes_pathname_prefix
+metrics.init_app(server, {
+    _prefix + '_dash-layout': 'layout',
+    _prefix + '_dash-update-component': 'callback',
+    **{api.PREFIX + resource: f'api-{resource}' for resource in api.RESOURCES}
+})
+metrics.register_stats('fetches', 'Upstream page requests', lambda: data.fetch_stats, list(data.fetch_stats))
+metrics.register_stats('refreshes', 'Data refreshes', lambda: refresh.status, ['refreshes', 'skipped', 'attaches'])
+metrics.register_stats('figure_cache', 'Figure cache', figcache.cache_stats, ['hits', 'misses', 'evictions', 'prewarms'])
+metrics.register_stats('layout_cache', 'Layout cache', lambda: layout_stats, list(layout_stats))
+metrics.register_stats('api_cache', 'API response cache', api.cache_stats, ['hits', 'misses', 'evictions', 'prewarms'])
+metrics.register_stats('http_cache', 'HTTP caching', lambda: httpcache.stats, list(httpcache.stats))
+metrics.register_stats('upstream_breaker', 'Upstream circuit breaker', lambda: breaker.status, ['opened', 'rejected'])
+metrics.register_gauge('upstream_breaker_state', 'State of the upstream circuit (0: closed, 1: half-open, 2: open)', breaker.state_code)
+metrics.register_gauge('upstream_consecutive_failures', 'Consecutive failed upstream requests', lambda: breaker.status['consecutive_failures'])
+metrics.register_gauge('figure_cache_bytes', 'Size of the cached figures in bytes', lambda: figcache.cache_stats()['bytes'])
+metrics.register_gauge('startup_ready_seconds', 'Time from the start of the app import until it was ready to serve', lambda: refresh.status['ready_duration'])
+metrics.register_gauge('dataset_version', 'Version of the current dataset', lambda: dataset.current() and dataset.current().version)
+metrics.register_gauge('dataset_age_seconds', 'Time since the current dataset was published', lambda: dataset.current() and time.time() - dataset.current().created)
+
+# Read-only data API (/api/v1/...)
+api.init_app(server)
+
+# ETag / 304 for the layout and callback responses (they change with the data, the code and these settings)
+httpcache.init_app(app, CODE_VERSION)
 
 # Callbacks
 
-# Callback for daily line chart radio buttons
-@app.callback(
-    Output(component_id='graph-daily', component_property='figure'),
-    Input(component_id='input-line', component_property='value'),
-    prevent_initial_call=True
-)
-def update_output_div(input_value):
-    return graphs.daily_line_chart(input_value)
+# Daily line chart figure for a radio button value and relayoutData of the graph
+# The default figure is downsampled (see graphs.DAILY_CHART_POINTS), so a
+# zoomed range is loaded again with the data of that range only.
+# Returns None for relayout events that do not change the range.
+def daily_figure(input_value, relayout_data):
+    window = graphs.relayout_window(relayout_data)
+    if window is not None:
+        return figcache.get_figure('daily-window', (input_value,) + window)
+    if relayout_data and 'xaxis.autorange' in relayout_data:
+        return figcache.get_figure('daily', input_value)
+    return None
 
-# Callback for gender pie chart radio buttons
-@app.callback(
-    Output(component_id='graph-info-by-gender', component_property='figure'),
-    Input(component_id='input-gender-pie', component_property='value'),
-    prevent_initial_call=True
-)
-def update_output_div(input_value):
-    return graphs.info_by_gender_pie_chart(input_value.lower())
 
+if CLIENTSIDE_SWITCHING:
+    # Figure of the zoomed range of the daily line chart (None: not zoomed in)
+    @app.callback(
+        Output(component_id='figure-daily-window', component_property='data'),
+        Input(component_id='graph-daily', component_property='relayoutData'),
+        State(component_id='input-line', component_property='value'),
+        prevent_initial_call=True
+    )
+    def update_daily_window(relayout_data, input_value):
+        figure = daily_figure(input_value, relayout_data)
+        if figure is None:
+            raise PreventUpdate
+        if graphs.relayout_window(relayout_data) is None:
+            return None
+        return {'value': input_value, 'figure': figure}
 
-# Callback for sunburst
-@app.callback(
-    Output(component_id='graph-info-by-age-group-and-gender', component_property='figure'),
-    Input(component_id='input-sunburst', component_property='value'),
-    prevent_initial_call=True
-)
-def update_output_div(input_value):
-    return graphs.info_by_age_group_and_gender_sunburst_chart(input_value.lower())
+    # Clientside callback for daily line chart: the zoomed range figure, or the figure from the store
+    app.clientside_callback(
+        """
+        function(value, window, figures) {
+            if (window && window.value === value) {
+                return window.figure;
+            }
+            return figures[value];
+        }
+        """,
+        Output(component_id='graph-daily', component_property='figure'),
+        Input(component_id='input-line', component_property='value'),
+        Input(component_id='figure-daily-window', component_property='data'),
+        State(component_id='figures-daily', component_property='data'),
+        prevent_initial_call=True
+    )
+
+    # Clientside callbacks for the radio buttons: pick the figure from the store
+    for graph_id, input_id, store_id in [
+        ('graph-info-by-gender', 'input-gender-pie', 'figures-gender-pie'),
+        ('graph-info-by-age-group-and-gender', 'input-sunburst', 'figures-sunburst'),
+    ]:
+        app.clientside_callback(
+            """
+            function(value, figures) {
+                return figures[value];
+            }
+            """,
+            Output(component_id=graph_id, component_property='figure'),
+            Input(component_id=input_id, component_property='value'),
+            State(component_id=store_id, component_property='data'),
+            prevent_initial_call=True
+        )
+
+else:
+    # Callback for daily line chart radio buttons and zoom
+    @app.callback(
+        Output(component_id='graph-daily', component_property='figure'),
+        Input(component_id='input-line', component_property='value'),
+        Input(component_id='graph-daily', component_property='relayoutData'),
+        prevent_initial_call=True
+    )
+    def update_output_div(input_value, relayout_data):
+        triggered = [item['prop_id'] for item in callback_context.triggered]
+        if 'graph-daily.relayoutData' not in triggered:
+            # Radio buttons: keep the zoomed range, if any
+            return daily_figure(input_value, relayout_data) or figcache.get_figure('daily', input_value)
+        figure = daily_figure(input_value, relayout_data)
+        if figure is None:
+            raise PreventUpdate
+        return figure
+
+    # Callback for gender pie chart radio buttons
+    @app.callback(
+        Output(component_id='graph-info-by-gender', component_property='figure'),
+        Input(component_id='input-gender-pie', component_property='value'),
+        prevent_initial_call=True
+    )
+    def update_output_div(input_value):
+        return figcache.get_figure('gender-pie', input_value.lower())
+
+    # Callback for sunburst
+    @app.callback(
+        Output(component_id='graph-info-by-age-group-and-gender', component_property='figure'),
+        Input(component_id='input-sunburst', component_property='value'),
+        prevent_initial_call=True
+    )
+    def update_output_div(input_value):
+        return figcache.get_figure('sunburst', input_value.lower())
 
 
 # Callback for modal
@@ -305,5 +576,10 @@ def toggle_modal(n1, is_open):
     return is_open
 
 
+# Time from the start of the import until the app is ready to serve (data, layout and callbacks)
+refresh.status['ready_duration'] = time.perf_counter() - _import_started
+print(f'Ready to serve in {refresh.status["ready_duration"] * 1000:.1f} ms')
+
+
 if __name__ == '__main__':
     app.run_server(debug=True, host="0.0.0.0")
@@ -0,0 +1,330 @@
+import contextlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+# Append-only archive of the daily stats of every ingested dataset
+#
+# Each row of the archive is the processed daily stats of one date as
+# published at one time: the date, the publication time (published) and the
+# numeric columns. Only new or changed rows are appended, so a refresh that
+# adds a day and corrects the last few ones appends only those rows. Rows are
+# stored as fixed size records (numpy structured dtype, described in
+# schema.json) appended to one file per month of their date
+# (daily_stats/YYYY-MM.bin), so a partially written record at the end of a
+# file (crash) is ignored when the archive is loaded. Appends hold a lock on
+# LOCK_FILE and first re-read the partitions that changed (size or
+# modification time) since they were read, so that processes that get the
+# same data (one per worker without a shared dataset) do not append it twice.
+#
+# Rows are appended with the archived dtypes: an integer column of new data
+# is stored as float, and if a column of new data cannot be stored in the
+# archived dtype (e.g. an integer column with a missing value, or a new
+# column), the schema is widened to float: all partitions are rewritten to a
+# new partitions directory, which schema.json then points to.
+#
+# The archive is held in memory as a single structured array sorted by date
+# and publication time, so range and as-of queries are binary searches on the
+# datetime64 date key plus a pass over the selected rows. Queries return
+# structured arrays (see to_frame).
+#
+# ARCHIVE_DIR='' disables the archive.
+
+FORMAT_VERSION = 1
+
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'data/archive')
+SCHEMA_FILE = 'schema.json'
+LOCK_FILE = 'archive.lock'
+PARTITIONS_DIR = 'daily_stats'
+
+_lock = threading.Lock()
+
+# Archived rows sorted by (date, published) and the latest row of each date,
+# replaced as a whole on appends (None until loaded)
+_archive = None
+
+# Partitions read from the archive: partitions directory and name -> (size, mtime, rows)
+_partitions_dir = None
+_partitions = {}
+
+
+def enabled():
+    return bool(ARCHIVE_DIR)
+
+
+def _schema_path(directory):
+    return os.path.join(directory, SCHEMA_FILE)
+
+
+# Record dtype of the archived rows of the daily stats
+def record_dtype(daily_stats):
+    fields = [('date', 'M8[D]'), ('published', 'M8[ms]')]
+    for name, dtype in daily_stats.dtypes.items():
+        if name != 'date' and np.issubdtype(dtype, np.number):
+            fields.append((name, 'f8' if np.issubdtype(dtype, np.floating) else 'i8'))
+    return np.dtype(fields)
+
+
+# Record dtype and partitions directory of the archive, or (None, None) if there is no archive
+def _read_schema(directory):
+    try:
+        with open(_schema_path(directory)) as f:
+            schema = json.load(f)
+    except FileNotFoundError:
+        return None, None
+
+    if schema.get('format') != FORMAT_VERSION:
+        raise ValueError(f'Unsupported archive format: {schema.get("format")}')
+    dtype = np.dtype([tuple(field) for field in schema['fields']])
+    return dtype, os.path.join(directory, schema.get('partitions', PARTITIONS_DIR))
+
+
+def _write_schema(directory, dtype, partitions=PARTITIONS_DIR):
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = _schema_path(directory) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(dict(
+            format=FORMAT_VERSION,
+            fields=[[name, dtype[name].str] for name in dtype.names],
+            partitions=partitions
+        ), f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, _schema_path(directory))
+
+
+def _read_partition(path, dtype):
+    with open(path, 'rb') as f:
+        content = f.read()
+    # Ignore a partially written record at the end
+    return np.frombuffer(content, dtype=dtype, count=len(content) // dtype.itemsize)
+
+
+# Sort rows by (date, published) and select the latest row of each date
+def _index(rows):
+    rows = rows[np.lexsort((rows['published'], rows['date']))]
+    dates = rows['date']
+    return rows, rows[np.append(dates[1:] != dates[:-1], True)] if len(rows) else rows
+
+
+# Archived rows and latest rows (see _archive), re-reading only the partitions
+# that changed since they were last read (None if there is no archive)
+def _read(directory):
+    global _partitions_dir, _partitions
+
+    dtype, partitions_dir = _read_schema(directory)
+    if dtype is None:
+        return None
+    if partitions_dir != _partitions_dir:
+        _partitions_dir, _partitions = partitions_dir, {}
+
+    names = sorted(name for name in os.listdir(partitions_dir) if name.endswith('.bin')) if os.path.isdir(partitions_dir) else []
+    partitions = {}
+    for name in names:
+        path = os.path.join(partitions_dir, name)
+        stat = os.stat(path)
+        partition = _partitions.get(name)
+        if partition is None or partition[:2] != (stat.st_size, stat.st_mtime_ns) or partition[2].dtype != dtype:
+            partition = (stat.st_size, stat.st_mtime_ns, _read_partition(path, dtype))
+        partitions[name] = partition
+
+    if _archive is not None and _archive[0].dtype == dtype and all(
+        _partitions.get(name) is partition for name, partition in partitions.items()
+    ) and len(partitions) == len(_partitions):
+        return _archive
+
+    _partitions = partitions
+    rows = [partition[2] for partition in partitions.values()]
+    return _index(np.concatenate(rows) if rows else np.empty(0, dtype=dtype))
+
+
+# Exclusive lock of the archive between processes
+@contextlib.contextmanager
+def _file_lock(directory):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_FILE), 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+# Load the archive into memory
+# Returns the number of archived rows.
+def load(directory=None):
+    global _archive
+
+    with _lock:
+        _archive = _read(directory or ARCHIVE_DIR)
+        return len(_archive[0]) if _archive is not None else 0
+
+
+# Archived rows and latest rows, loaded if needed (None if there is no archive)
+def _loaded(directory):
+    if _archive is None:
+        load(directory)
+    return _archive
+
+
+# Archived rows of the daily stats (DataFrame) that are new or changed since the latest archived rows
+def _changed_rows(daily_stats, dtype, published):
+    rows = np.empty(len(daily_stats), dtype=dtype)
+    rows['date'] = pd.to_datetime(daily_stats['date']).to_numpy().astype('M8[D]')
+    rows['published'] = np.datetime64(int(published * 1000), 'ms')
+    for name in dtype.names[2:]:
+        rows[name] = daily_stats[name].to_numpy() if name in daily_stats else np.nan
+
+    if _archive is None:
+        return rows
+
+    # Latest archived row of each date (binary search on the sorted dates)
+    latest = _archive[1]
+    positions = np.searchsorted(latest['date'], rows['date'])
+    found = positions < len(latest)
+    found[found] = latest['date'][positions[found]] == rows['date'][found]
+
+    changed = ~found
+    previous = latest[positions[found]]
+    for name in dtype.names[2:]:
+        a, b = rows[name][found], previous[name]
+        same = (a == b) | (np.isnan(a) & np.isnan(b)) if a.dtype.kind == 'f' else a == b
+        changed[found] |= ~same
+    return rows[changed]
+
+
+# Record dtype that holds both the archived rows and the daily stats (DataFrame)
+# Columns missing on either side, and integer columns with non-integer values
+# (e.g. a missing value) on either side, are floats.
+def _widened_dtype(archived, daily_stats):
+    incoming = record_dtype(daily_stats)
+    names = list(archived.names) + [name for name in incoming.names if name not in archived.names]
+
+    fields = [('date', archived['date']), ('published', archived['published'])]
+    for name in names[2:]:
+        if name not in archived.names or name not in incoming.names or archived[name].kind == 'f':
+            fields.append((name, 'f8'))
+        elif incoming[name].kind == 'f':
+            values = daily_stats[name].to_numpy()
+            integral = np.isfinite(values).all() and (values == np.round(values)).all()
+            fields.append((name, 'i8' if integral else 'f8'))
+        else:
+            fields.append((name, 'i8'))
+    return np.dtype(fields)
+
+
+# Rewrite all partitions with a wider dtype to a new partitions directory, then point the schema to it
+def _rewrite(directory, dtype):
+    _, previous_dir = _read_schema(directory)
+    name = f'{PARTITIONS_DIR}-{uuid.uuid4().hex[:8]}'
+    partitions_dir = os.path.join(directory, name)
+    os.makedirs(partitions_dir)
+
+    for partition_name, (_, _, rows) in _partitions.items():
+        converted = np.empty(len(rows), dtype=dtype)
+        for field in dtype.names:
+            converted[field] = rows[field] if field in rows.dtype.names else np.nan
+        with open(os.path.join(partitions_dir, partition_name), 'wb') as f:
+            f.write(converted.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    _write_schema(directory, dtype, name)
+    shutil.rmtree(previous_dir, ignore_errors=True)
+    print(f'Archive schema widened: {", ".join(name for name in dtype.names[2:])}')
+
+
+# Append the new and changed rows of the daily stats (DataFrame) published at the given time
+# Returns the number of appended rows.
+def append(daily_stats, published=None, directory=None):
+    global _archive
+
+    directory = directory or ARCHIVE_DIR
+    published = time.time() if published is None else published
+
+    with _lock, _file_lock(directory):
+        _archive = _read(directory)
+        if _archive is None:
+            dtype = record_dtype(daily_stats)
+            _write_schema(directory, dtype)
+        else:
+            dtype = _widened_dtype(_archive[0].dtype, daily_stats)
+            if dtype != _archive[0].dtype:
+                _rewrite(directory, dtype)
+                _archive = _read(directory)
+
+        rows = _changed_rows(daily_stats, dtype, published)
+        if not len(rows):
+            return 0
+
+        # Append to the partition (month) of each row
+        _, partitions_dir = _read_schema(directory)
+        os.makedirs(partitions_dir, exist_ok=True)
+        months = rows['date'].astype('M8[M]')
+        for month in np.unique(months):
+            with open(os.path.join(partitions_dir, f'{month}.bin'), 'ab') as f:
+                f.write(rows[months == month].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        # Re-read the partitions that were appended to
+        _archive = _read(directory)
+        return len(rows)
+
+
+def _date_range(rows, start, end):
+    dates = rows['date']
+    first = 0 if start is None else np.searchsorted(dates, np.datetime64(start, 'D'), side='left')
+    last = len(dates) if end is None else np.searchsorted(dates, np.datetime64(end, 'D'), side='right')
+    return first, last
+
+
+# All archived revisions of the dates start..end (inclusive, None: unbounded)
+def revisions(start=None, end=None, directory=None):
+    loaded = _loaded(directory or ARCHIVE_DIR)
+    if loaded is None:
+        return None
+    rows = loaded[0]
+    first, last = _date_range(rows, start, end)
+    return rows[first:last]
+
+
+# Daily stats of the dates start..end (inclusive, None: unbounded) as published at the given time
+# (datetime64, datetime, string, or seconds since the epoch; None: latest)
+def as_of(published=None, start=None, end=None, directory=None):
+    loaded = _loaded(directory or ARCHIVE_DIR)
+    if loaded is None:
+        return None
+    rows, latest = loaded
+
+    if published is None:
+        first, last = _date_range(latest, start, end)
+        return latest[first:last]
+
+    if isinstance(published, (int, float)):
+        published = np.datetime64(int(published * 1000), 'ms')
+    published = np.datetime64(published, 'ms')
+
+    first, last = _date_range(rows, start, end)
+    selected = rows[first:last]
+
+    # Last row of each date published at the given time or before
+    indices = np.flatnonzero(selected['published'] <= published)
+    dates = selected['date'][indices]
+    return selected[indices[np.append(dates[1:] != dates[:-1], True)]] if len(indices) else selected[:0]
+
+
+# DataFrame of archived rows, with the date as a string column (as in the processed daily stats)
+def to_frame(rows):
+    df = pd.DataFrame(rows)
+    df['date'] = np.datetime_as_string(rows['date'])
+    return df
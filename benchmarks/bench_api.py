@@ -0,0 +1,46 @@
+# Benchmark of the data API on synthetic data
+# Compares serializing the daily stats with pandas (JSON records and CSV,
+# then gzip) with the API responses: a cached response (a hit), and a new
+# page of a new filter (joined from the encoded cells, then compressed).
+# Usage: python benchmarks/bench_api.py [years]
+import gzip
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import api
+import data
+import synthetic
+
+
+def main(years=3, number=20):
+    raw = synthetic.raw_data(years)
+    ds = data.set_data(dict(
+        df_daily_stats=data.process_daily_stats(raw['df_daily_stats']),
+        df_total_stats=data.process_total_stats(raw['df_total_stats'])
+    ))
+    df = ds.daily_stats.iloc[:api.API_PAGE_SIZE]
+
+    def timed(func):
+        return min(timeit.repeat(func, number=number, repeat=5)) / number * 1000
+
+    t_table = timed(lambda: api.Table(ds.daily_stats, True))
+    print(f'{years} year(s) of data, {len(df)} rows per page, cells encoded in {t_table:.2f} ms per version')
+    for format in api.FORMATS:
+        if format == 'json':
+            def serialize():
+                return gzip.compress(df.to_json(orient='records').encode(), compresslevel=6)
+        else:
+            def serialize():
+                return gzip.compress(df.to_csv(index=False).encode(), compresslevel=6)
+
+        api.get_response('daily', dict(format=format), ds)
+        misses = iter(range(10 ** 9))
+        print(f'{format:<5} pandas + gzip {timed(serialize):8.3f} ms   '
+              f'API hit {timed(lambda: api.get_response("daily", dict(format=format), ds)):8.4f} ms   '
+              f'API miss (encode + gzip + brotli) {timed(lambda: api.get_response("daily", dict(format=format, limit=str(api.API_PAGE_SIZE - next(misses) % 500)), ds)):8.3f} ms')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
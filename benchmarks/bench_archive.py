@@ -0,0 +1,79 @@
+# Benchmark of the archive queries on synthetic data with many revisions
+# Each revision adds a day and corrects the last days, as the upstream data
+# does. Compares range and as-of queries (binary search on the sorted
+# datetime64 dates) with a linear scan of a frame of all revisions with a
+# string date column, and checks that they return the same rows.
+# Usage: python benchmarks/bench_archive.py [revisions]
+import os
+import sys
+import tempfile
+import timeit
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import archive
+import data
+import synthetic
+
+
+# Daily stats of revisions days (after a first year), with the last 3 days corrected in each revision
+def revisions(count, seed=0):
+    raw = synthetic.daily_stats(365 + count, seed=seed)
+    rng = np.random.default_rng(seed)
+    for i in range(count):
+        df = raw.iloc[:365 + i + 1].copy()
+        df.loc[df.index[-3:], 'cases'] += rng.integers(0, 10, 3)
+        df['total_cases'] = df['cases'].cumsum()
+        yield data.process_daily_stats(df)
+
+
+# Previous: one frame of all revisions, string dates, filtered with a linear scan
+def scan_as_of(frame, published, start, end):
+    df = frame[(frame['date'] >= start) & (frame['date'] <= end) & (frame['published'] <= published)]
+    return df.sort_values(['date', 'published']).groupby('date').tail(1)
+
+
+def main(count=2000, number=200):
+    directory = tempfile.mkdtemp()
+    frames = []
+    t_append = 0
+    for i, df in enumerate(revisions(count)):
+        published = 1.6e9 + i * 86400
+        t_append += timeit.timeit(lambda: archive.append(df, published=published, directory=directory), number=1)
+        frames.append(df.assign(published=np.datetime64(int(published * 1000), 'ms')))
+    frame = pd.concat(frames, ignore_index=True)
+
+    t_load = timeit.timeit(lambda: archive.load(directory), number=1)
+    rows = len(archive.revisions(directory=directory))
+    size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names if name.endswith('.bin'))
+    print(f'{count} revisions: {len(frame)} rows ingested, {rows} archived ({size / 1024:.0f} KiB), '
+          f'append {t_append / count * 1000:.2f} ms, load {t_load * 1000:.1f} ms')
+
+    # Daily stats of a quarter, as published a year before the last revision
+    published = np.datetime64(int((1.6e9 + (count - 365) * 86400) * 1000), 'ms')
+    start, end = '2020-06-01', '2020-08-31'
+
+    expected = scan_as_of(frame, published, start, end)
+    result = archive.to_frame(archive.as_of(published, start, end, directory=directory))
+    columns = [name for name in result.columns if name != 'published']
+    assert len(result) == len(expected) == 92
+    assert np.allclose(result[columns[1:]].to_numpy(float), expected[columns[1:]].to_numpy(float), equal_nan=True)
+    assert list(result['date']) == list(expected['date'])
+
+    latest = archive.to_frame(archive.as_of(directory=directory))
+    assert latest[columns[1:]].equals(frames[-1][columns[1:]].astype(latest[columns[1:]].dtypes))
+
+    def timed(func, number=number):
+        return min(timeit.repeat(func, number=number, repeat=5)) / number * 1000
+
+    print(f'as-of, quarter   scan {timed(lambda: scan_as_of(frame, published, start, end), number=3):8.3f} ms   '
+          f'archive {timed(lambda: archive.as_of(published, start, end, directory=directory)):8.4f} ms')
+    print(f'latest, quarter  scan {timed(lambda: frames[-1][(frames[-1]["date"] >= start) & (frames[-1]["date"] <= end)]):8.3f} ms   '
+          f'archive {timed(lambda: archive.as_of(None, start, end, directory=directory)):8.4f} ms')
+    print(f'revisions, month scan {timed(lambda: frame[(frame["date"] >= "2020-07-01") & (frame["date"] <= "2020-07-31")], number=3):8.3f} ms   '
+          f'archive {timed(lambda: archive.revisions("2020-07-01", "2020-07-31", directory=directory)):8.4f} ms')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,50 @@
+# Benchmark of the default view of the timeline chart (figure build + serialization)
+# Compares the full resolution figure with the LTTB downsampled one (see
+# graphs.DAILY_CHART_POINTS) for histories of 1 to 10 years: payload bytes,
+# build time, and points per trace (the browser render time grows with the
+# number of points), and the figure of a zoomed range of 60 days.
+# Usage: python benchmarks/bench_daily_chart.py
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import data
+import graphs
+import synthetic
+
+
+def set_synthetic_data(years):
+    raw = synthetic.raw_data(years)
+    return data.set_data(dict(
+        df_daily_stats=data.process_daily_stats(raw['df_daily_stats']),
+        df_total_stats=data.process_total_stats(raw['df_total_stats'])
+    ))
+
+
+def measure(build, number):
+    size = len(build().to_json())
+    points = len(build().data[0].x)
+    seconds = min(timeit.repeat(lambda: build().to_json(), number=number, repeat=5)) / number
+    return size, points, seconds
+
+
+def main(number=10):
+    for years in (1, 3, 10):
+        ds = set_synthetic_data(years)
+        dates = ds.daily_stats['date']
+        window = (dates.iloc[len(dates) // 2], dates.iloc[len(dates) // 2 + 60])
+
+        print(f'{years} year(s), {len(dates)} days, budget {graphs.DAILY_CHART_POINTS} points')
+        for input in ('Daily', 'Weekly average'):
+            for name, build in [
+                ('full', lambda: graphs.daily_line_chart(input, ds=ds, max_points=0)),
+                ('downsampled', lambda: graphs.daily_line_chart(input, ds=ds)),
+                ('zoomed 60 days', lambda: graphs.daily_line_chart(input, ds=ds, window=window)),
+            ]:
+                size, points, seconds = measure(build, number)
+                print(f'  {input:<15} {name:<15} {size / 1024:8.1f} KiB {points:6} points {seconds * 1000:7.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
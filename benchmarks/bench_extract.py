@@ -0,0 +1,65 @@
+# Benchmark of the stats extraction from the innews page
+# Compares extract.extract_stats with the previous BeautifulSoup + regex path
+# on the saved page fixture (both including json.loads of every payload).
+# Usage: python benchmarks/bench_extract.py (requires benchmarks/requirements.txt)
+import os
+import sys
+import re
+import json
+import timeit
+import bs4
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import extract
+
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'innews.html')
+
+
+# Previous extraction path: full DOM build, third script tag, one regex scan per variable
+def extract_bs4_raw(text):
+    soup = bs4.BeautifulSoup(text, 'html.parser')
+    script_tag = soup.find_all('script')[2]
+    return dict(
+        daily_stats=re.search(r"var daily_stats = (\[.*\])", script_tag.string).group(1),
+        weekly_stats=re.search(r"var weekly_stats = (\[.*\])", script_tag.string).group(1),
+        three_days_stats=re.search(r"var three_days_stats = (\[.*\])", script_tag.string).group(1),
+        total_stats=re.search(r"var total_stats = (\{.*\})", script_tag.string).group(1),
+    )
+
+
+def extract_bs4(text):
+    return {name: json.loads(raw) for name, raw in extract_bs4_raw(text).items()}
+
+
+# Single-pass extraction
+def extract_single_pass(content):
+    raw_stats = extract.extract_stats(content)
+    return {name: json.loads(raw_stats[name]) for name in extract.REQUIRED_STATS}
+
+
+def bench(name, func, arg, number):
+    best = min(timeit.repeat(lambda: func(arg), number=number, repeat=5)) / number
+    print(f'{name:<20} {best * 1000:9.3f} ms')
+    return best
+
+
+def main(number=20):
+    with open(FIXTURE, 'rb') as f:
+        content = f.read()
+    text = content.decode()
+
+    # The previous path also parsed the scraped averages, which are now calculated (see rolling)
+    expected = extract_bs4(text)
+    assert extract_single_pass(content) == {name: expected[name] for name in extract.REQUIRED_STATS}
+
+    print(f'Fixture: {FIXTURE} ({len(content) / 1024:.1f} KiB)')
+    t_bs4_raw = bench('bs4 + regex (raw)', extract_bs4_raw, text, number)
+    t_single_raw = bench('single pass (raw)', extract.extract_stats, content, number)
+    t_bs4 = bench('bs4 + regex', extract_bs4, text, number)
+    t_single = bench('single pass', extract_single_pass, content, number)
+    print(f'Speedup: {t_bs4_raw / t_single_raw:.1f}x extraction only, {t_bs4 / t_single:.1f}x including json.loads')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# Benchmark of the figure serialization of all charts and inputs
+# Compares plotly's to_json (the previous encoding, with lists of numbers)
+# with figjson.to_json with plain lists and with typed arrays: serialization
+# time of the built figure, and response size (uncompressed and gzip). The
+# build time of each figure is reported separately.
+# Usage: python benchmarks/bench_figure_json.py [years]
+import gzip
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import data
+import figcache
+import figjson
+import synthetic
+
+
+ENCODINGS = {
+    'plotly': lambda fig: fig.to_json(),
+    'plain': lambda fig: figjson.to_json(fig, typed_arrays=False),
+    'typed': lambda fig: figjson.to_json(fig, typed_arrays=True),
+}
+
+
+def main(years=3, number=10):
+    raw = synthetic.raw_data(years)
+    ds = data.set_data(dict(
+        df_daily_stats=data.process_daily_stats(raw['df_daily_stats']),
+        df_total_stats=data.process_total_stats(raw['df_total_stats'])
+    ))
+
+    print(f'{years} year(s) of data; time in ms, size in KiB (gzip)')
+    print(f'{"figure":<28}{"build":>8}' + ''.join(f'{name:>24}' for name in ENCODINGS))
+    for chart, (builder, inputs) in figcache.CHARTS.items():
+        for input in inputs:
+            build = min(timeit.repeat(lambda: builder(input, ds), number=number, repeat=5)) / number
+            fig = builder(input, ds)
+            results = []
+            for encode in ENCODINGS.values():
+                value = encode(fig)
+                seconds = min(timeit.repeat(lambda: encode(fig), number=number, repeat=5)) / number
+                results.append(f'{seconds * 1000:7.2f} {len(value) / 1024:6.1f} ({len(gzip.compress(value.encode())) / 1024:5.1f})')
+            print(f'{chart + " " + str(input):<28}{build * 1000:8.2f}' + ''.join(f'{result:>24}' for result in results))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
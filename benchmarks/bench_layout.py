@@ -0,0 +1,73 @@
+# Benchmark of the layout (page load) on synthetic data
+# Compares the previous memoized layout (the whole component tree pickled in
+# the cache, serialized by Dash on every page load) with the static shell
+# and the compressed per-version fragments: cache entry sizes and layout
+# response time (cached, new dataset version, and fragments from the cache
+# of another worker).
+# Usage: python benchmarks/bench_layout.py [years]
+import os
+import sys
+import pickle
+import tempfile
+import timeit
+import zlib
+
+# The app loads the data at import: use a snapshot of synthetic data, and no refreshes
+_workdir = tempfile.mkdtemp()
+os.environ['SNAPSHOT_DIR'] = os.path.join(_workdir, 'snapshot')
+os.environ['REFRESH_INTERVAL'] = os.environ['REFRESH_JITTER'] = str(24 * 60 * 60)
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import data
+import synthetic
+
+
+def save_synthetic_data(years):
+    raw = synthetic.raw_data(years)
+    data.save_data(dict(
+        df_daily_stats=data.process_daily_stats(raw['df_daily_stats']),
+        df_total_stats=data.process_total_stats(raw['df_total_stats'])
+    ))
+
+
+def main(years=3, number=50):
+    save_synthetic_data(years)
+    os.chdir(_workdir)
+    import app
+    from plotly.io.json import to_json_plotly
+
+    client = app.server.test_client()
+    ds = app.dataset.current()
+
+    # Previous: memoized component tree
+    entry = pickle.dumps(app.create_layout())
+    t_previous = min(timeit.repeat(lambda: to_json_plotly(pickle.loads(entry)), number=number, repeat=5)) / number
+
+    # Shell and fragments
+    fragments = {name: zlib.compress(app.layout_fragment_json(name, ds).encode()) for name in app.LAYOUT_FRAGMENTS}
+    t_hit = min(timeit.repeat(lambda: client.get('/_dash-layout'), number=number, repeat=5)) / number
+
+    def new_version():
+        app._layout_json = (None, None)
+    t_fragments = min(timeit.repeat(lambda: (new_version(), client.get('/_dash-layout')), number=number, repeat=5)) / number
+
+    def new_worker():
+        app._layout_json = (None, None)
+        app.cache.clear()
+        app.figcache.discard_other_versions(None)
+    t_build = min(timeit.repeat(lambda: (new_worker(), client.get('/_dash-layout')), number=5, repeat=3)) / 5
+
+    size = len(client.get('/_dash-layout').data)
+    print(f'{years} year(s) of data, layout {size / 1024:.1f} KiB')
+    print(f'Previous cache entry (pickled tree)    {len(entry) / 1024:8.1f} KiB')
+    for name, value in fragments.items():
+        print(f'Fragment {name:<30}{len(value) / 1024:8.1f} KiB')
+    print(f'Fragments total (compressed)           {sum(map(len, fragments.values())) / 1024:8.1f} KiB')
+    print(f'Previous memoized layout (unpickle + serialize) {t_previous * 1000:8.2f} ms')
+    print(f'Layout, cached                                   {t_hit * 1000:8.2f} ms')
+    print(f'Layout, new version, fragments cached            {t_fragments * 1000:8.2f} ms')
+    print(f'Layout, nothing cached (builds the figures)      {t_build * 1000:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
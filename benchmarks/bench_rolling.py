@@ -0,0 +1,34 @@
+# Benchmark of the rolling averages (rolling.rolling_stats)
+# Times full and incremental calculation (one new day) on synthetic
+# multi-year series. Their results are checked in tests/test_rolling.py.
+# Usage: python benchmarks/bench_rolling.py
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import data
+import rolling
+import synthetic
+
+
+def bench(years, number=20):
+    days = int(years * 365)
+    df_raw = synthetic.daily_stats(days)
+    df_daily_stats = data.process_daily_stats(df_raw)
+    df_previous = data.process_daily_stats(df_raw.iloc[:-1])
+
+    for window in (3, 7, 28):
+        previous = (df_previous, rolling.rolling_stats(df_previous, window))
+        t_full = min(timeit.repeat(lambda: rolling.rolling_stats(df_daily_stats, window), number=number, repeat=5)) / number
+        t_incremental = min(timeit.repeat(lambda: rolling.rolling_stats(df_daily_stats, window, previous=previous), number=number, repeat=5)) / number
+        print(f'{years:>3} years ({days} days), window {window:>2}: full {t_full * 1000:7.3f} ms, incremental {t_incremental * 1000:7.3f} ms')
+
+
+def main():
+    for years in (1, 10, 30):
+        bench(years)
+
+
+if __name__ == '__main__':
+    main()
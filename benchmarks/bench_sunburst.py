@@ -0,0 +1,76 @@
+# Benchmark of the sunburst callback (figure build + serialization)
+# Compares the direct hierarchy builder with the previous version that went
+# through a throwaway px.sunburst, and the import time of plotly.express.
+# Usage: python benchmarks/bench_sunburst.py
+import os
+import sys
+import subprocess
+import timeit
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import data
+import graphs
+import synthetic
+
+
+# Previous version of graphs.info_by_age_group_and_gender_sunburst_chart
+def sunburst_chart_px(cat, ds):
+    agg = ds.aggregates
+
+    df = pd.DataFrame({
+        'age': np.repeat(agg.age_labels, len(agg.genders)),
+        'gender': np.tile(agg.genders, len(agg.ages)),
+        'value': agg.by_age_and_gender[cat].ravel()
+    })
+
+    fig_tmp = px.sunburst(df, path=['age', 'gender'], values='value')
+
+    fatality = dict(zip(agg.age_labels, agg.fatality_by_age.tolist()))
+    for i, label in enumerate(agg.age_labels):
+        for j, gender in enumerate(agg.genders):
+            fatality[f'{label}/{gender}'] = float(agg.fatality_by_age_and_gender[i, j])
+    sunburst_fatality_values = [fatality[id] for id in fig_tmp.data[0].ids]
+
+    fig = go.Figure()
+    fig.add_trace(go.Sunburst(
+        ids=fig_tmp.data[0].ids,
+        labels=fig_tmp.data[0].labels,
+        parents=fig_tmp.data[0].parents,
+        values=fig_tmp.data[0].values,
+        branchvalues="total",
+        name=cat,
+    ))
+    fig.update_layout(margin=dict(t=0, l=0, r=0, b=0), template=graphs.template)
+    fig.update_traces(textinfo="label+percent parent", insidetextorientation='horizontal')
+    if cat=='deceased':
+        fig.update_traces(hovertext=[f'Fatality: {val:.3f} %' for val in sunburst_fatality_values])
+    return fig
+
+
+def import_time(module):
+    code = f'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+    return min(float(subprocess.check_output([sys.executable, '-c', code])) for _ in range(3))
+
+
+def main(number=50):
+    raw = synthetic.raw_data()
+    ds = data.set_data(dict(
+        df_daily_stats=data.process_daily_stats(raw['df_daily_stats']),
+        df_total_stats=data.process_total_stats(raw['df_total_stats'])
+    ))
+
+    for cat in ('cases', 'deceased', 'intubated'):
+        t_px = min(timeit.repeat(lambda: sunburst_chart_px(cat, ds).to_json(), number=number, repeat=5)) / number
+        t_direct = min(timeit.repeat(lambda: graphs.info_by_age_group_and_gender_sunburst_chart(cat, ds).to_json(), number=number, repeat=5)) / number
+        print(f'{cat:<10} px.sunburst {t_px * 1000:7.3f} ms, direct {t_direct * 1000:7.3f} ms ({t_px / t_direct:.1f}x)')
+
+    print(f'Import plotly.graph_objects: {import_time("plotly.graph_objects") * 1000:7.1f} ms')
+    print(f'Import plotly.express:       {import_time("plotly.express") * 1000:7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# Microbenchmark of the total stats decoding and aggregation
+# Compares process_total_stats with the previous row-wise apply version, and
+# sums/fatality ratios from the total stats cube with groupby on the long table.
+# Usage: python benchmarks/bench_total_stats.py
+import os
+import sys
+import timeit
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import data
+import totals
+import synthetic
+
+
+# Previous version of data.process_total_stats
+def process_total_stats_apply(series):
+    df_total_stats = pd.DataFrame(series)
+    df_total_stats.rename(columns={0: 'value'}, inplace=True)
+    df_total_stats.drop(['id','date','created_at', 'updated_at'], inplace=True)
+    df_total_stats.reset_index(inplace=True)
+    df_total_stats['category'] = df_total_stats.apply(lambda row: row['index'].split('_')[0], axis=1)
+    df_total_stats['age'] = df_total_stats.apply(lambda row: '_'.join(row['index'].split('_')[1:-1]), axis=1)
+    df_total_stats['gender'] = df_total_stats.apply(lambda row: row['index'].split('_')[-1], axis=1)
+    df_total_stats.set_index('index', inplace=True)
+    df_total_stats['value'] = df_total_stats['value'].astype(int)
+    return df_total_stats
+
+
+# Breakdowns used by the charts, with groupby on the long table
+def aggregate_groupby(df):
+    return dict(
+        by_gender=df.groupby(['category', 'gender'])[['value']].sum().loc['cases', 'value'].to_numpy(),
+        by_age=df.groupby(['category', 'age'])[['value']].sum().loc['cases', 'value'].to_numpy(),
+        fatality_by_age=(
+            df[df['category']=='deceased'].groupby('age')['value'].sum()
+            / df[df['category']=='cases'].groupby('age')['value'].sum() * 100
+        ).to_numpy(),
+        fatality_by_age_and_gender=(
+            df[df['category']=='deceased'].groupby(['age', 'gender'])['value'].sum()
+            / df[df['category']=='cases'].groupby(['age', 'gender'])['value'].sum() * 100
+        ).to_numpy(),
+    )
+
+
+# Same breakdowns from the cube
+def aggregate_cube(cube):
+    return dict(
+        by_gender=cube.by_gender('cases'),
+        by_age=cube.by_age('cases'),
+        fatality_by_age=cube.fatality(by='age'),
+        fatality_by_age_and_gender=cube.fatality(),
+    )
+
+
+def bench(name, func, number=200):
+    best = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f'{name:<28} {best * 1000:8.3f} ms')
+    return best
+
+
+def main():
+    series = synthetic.total_stats()
+    df = data.process_total_stats(series)
+    cube = totals.from_total_stats(df)
+
+    pd.testing.assert_frame_equal(process_total_stats_apply(series), df, check_exact=True)
+
+    # groupby sorts the labels, the cube keeps the order of the table
+    expected = aggregate_groupby(df)
+    ages = np.argsort(cube.ages)
+    genders = np.argsort(cube.genders)
+    actual = aggregate_cube(cube)
+    np.testing.assert_array_equal(actual['by_gender'][genders], expected['by_gender'])
+    np.testing.assert_array_equal(actual['by_age'][ages], expected['by_age'])
+    np.testing.assert_allclose(actual['fatality_by_age'][ages], expected['fatality_by_age'])
+    np.testing.assert_allclose(actual['fatality_by_age_and_gender'][ages][:, genders].ravel(), expected['fatality_by_age_and_gender'])
+
+    t_apply = bench('process_total_stats (apply)', lambda: process_total_stats_apply(series))
+    t_vectorized = bench('process_total_stats', lambda: data.process_total_stats(series))
+    t_cube = bench('cube from total stats', lambda: totals.from_total_stats(df))
+    print(f'Decoding speedup: {t_apply / (t_vectorized + t_cube):.1f}x (including the cube)')
+
+    t_groupby = bench('aggregates (groupby)', lambda: aggregate_groupby(df))
+    t_slices = bench('aggregates (cube)', lambda: aggregate_cube(cube))
+    print(f'Aggregation speedup: {t_groupby / t_slices:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+# Load test of the app under gunicorn, against a local stand-in of the upstream page
+# Starts `gunicorn app:server` for each combination of worker and thread
+# counts, with UPSTREAM_URL pointing at a local server that serves the
+# recorded innews page (benchmarks/fixtures/innews.html), and runs these
+# scenarios with concurrent virtual users (no network access):
+#   layout: initial page loads (_dash-layout)
+#   callbacks: bursts of radio-button callbacks (each user clicks through
+#       the options of a chart)
+#   expiry: page loads and callback bursts while the upstream page gets a
+#       new day of data every --expire-every seconds, so all workers refresh
+#       and rebuild their layouts and figures under load
+# Reports throughput and p50/p95/p99 latency per endpoint, and saves them as
+# JSON in benchmarks/results/loadtest-<commit>.json (see run.py).
+# Usage:
+#   python benchmarks/loadtest.py [--workers 1 2 4] [--threads 1 4] [--users 16] [--duration 20]
+import argparse
+import datetime
+import hashlib
+import http.server
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import requests
+
+import run
+import synthetic
+
+
+ROOT = run.ROOT
+
+SCENARIOS = ['layout', 'callbacks', 'expiry']
+
+# Radio-button callbacks: endpoint label -> (output, input id, options, extra inputs)
+CALLBACKS = {
+    'callback:daily': (
+        'graph-daily.figure', 'input-line',
+        ['Daily', 'Running total', '3-day average', 'Weekly average'],
+        [{'id': 'graph-daily', 'property': 'relayoutData', 'value': None}]
+    ),
+    'callback:gender-pie': (
+        'graph-info-by-gender.figure', 'input-gender-pie',
+        ['cases', 'deceased', 'intubated'], []
+    ),
+    'callback:sunburst': (
+        'graph-info-by-age-group-and-gender.figure', 'input-sunburst',
+        ['cases', 'deceased', 'intubated'], []
+    ),
+}
+
+
+# Recorded page with days more days of data (a new upstream version per day)
+def page_version(content, days):
+    text = content.decode()
+    match = re.search(r'var daily_stats = (.*);', text)
+    daily_stats = json.loads(match.group(1))
+    last = daily_stats[-1]
+    for i in range(1, days + 1):
+        date = datetime.date.fromisoformat(last['date']) + datetime.timedelta(days=i)
+        daily_stats.append(dict(last, date=date.isoformat(), cases=last['cases'] + i, total_cases=last['total_cases'] + i * last['cases']))
+    return (text[:match.start(1)] + json.dumps(daily_stats) + text[match.end(1):]).encode()
+
+
+# Local stand-in of the upstream page: serves the current page with an ETag (and 304s)
+class Upstream(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, content):
+        super().__init__(('127.0.0.1', 0), UpstreamHandler)
+        self.recorded = content
+        self.counts = dict(ok=0, not_modified=0)
+        self.set_version(0)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/'
+
+    def set_version(self, days):
+        content = page_version(self.recorded, days) if days else self.recorded
+        self.page = (content, f'"{hashlib.sha256(content).hexdigest()[:16]}"')
+
+
+class UpstreamHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        content, etag = self.server.page
+        if self.headers.get('If-None-Match') == etag:
+            self.server.counts['not_modified'] += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.server.counts['ok'] += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# gunicorn app:server in a temporary working directory, started with blocking startup (gets the upstream page)
+class Server:
+    def __init__(self, upstream_url, workers, threads, refresh_interval, env=None):
+        self.workdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.workdir, 'data'))
+        self.url = f'http://127.0.0.1:{free_port()}'
+        self.log = open(os.path.join(self.workdir, 'gunicorn.log'), 'w')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'app:server',
+             '--pythonpath', ROOT, '--chdir', self.workdir,
+             '--bind', self.url[len('http://'):],
+             '--workers', str(workers), '--threads', str(threads)],
+            env=dict(
+                os.environ,
+                UPSTREAM_URL=upstream_url,
+                SNAPSHOT_DIR=os.path.join(self.workdir, 'snapshot'),
+                STARTUP_MODE='blocking',
+                REFRESH_INTERVAL=str(refresh_interval),
+                REFRESH_JITTER=str(refresh_interval / 4),
+                **(env or {})
+            ),
+            stdout=self.log, stderr=subprocess.STDOUT
+        )
+
+    def wait_ready(self, timeout=120):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                if requests.get(self.url + '/_dash-layout', timeout=5).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.5)
+        self.stop()
+        with open(self.log.name) as f:
+            raise RuntimeError(f'gunicorn did not start:\n{f.read()[-2000:]}')
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.log.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+# Virtual user: sends requests until stop is set, records (endpoint, seconds, ok)
+class User(threading.Thread):
+    def __init__(self, url, scenario, stop, burst, think_time, seed):
+        super().__init__(daemon=True)
+        self.url = url
+        self.scenario = scenario
+        self.stop = stop
+        self.burst = burst
+        self.think_time = think_time
+        self.random = random.Random(seed)
+        self.session = requests.Session()
+        self.samples = []
+
+    def request(self, endpoint, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            ok = self.session.request(method, self.url + path, timeout=60, **kwargs).status_code == 200
+        except requests.RequestException:
+            ok = False
+        self.samples.append((endpoint, time.perf_counter() - started, ok))
+
+    def load_layout(self):
+        self.request('layout', 'GET', '/_dash-layout')
+
+    # Click through burst options of a radio-button group, without waiting between clicks
+    def callback_burst(self):
+        endpoint = self.random.choice(list(CALLBACKS))
+        output, input_id, options, extra_inputs = CALLBACKS[endpoint]
+        component_id, component_property = output.split('.')
+        for _ in range(self.burst):
+            body = {
+                'output': output,
+                'outputs': {'id': component_id, 'property': component_property},
+                'inputs': [{'id': input_id, 'property': 'value', 'value': self.random.choice(options)}, *extra_inputs],
+                'changedPropIds': [f'{input_id}.value'],
+                'state': []
+            }
+            self.request(endpoint, 'POST', '/_dash-update-component', json=body)
+
+    def run(self):
+        while not self.stop.is_set():
+            if self.scenario == 'layout':
+                self.load_layout()
+            elif self.scenario == 'callbacks':
+                self.callback_burst()
+            else:
+                self.load_layout()
+                self.callback_burst()
+            if self.think_time:
+                self.stop.wait(self.random.uniform(0, 2 * self.think_time))
+
+
+# Count, errors, throughput and latency percentiles (ms) per endpoint
+def summarize(samples, seconds):
+    endpoints = {}
+    for endpoint, latency, ok in samples:
+        endpoints.setdefault(endpoint, []).append((latency, ok))
+    endpoints['all'] = [(latency, ok) for _, latency, ok in samples]
+
+    summary = {}
+    for endpoint, values in sorted(endpoints.items()):
+        latencies = np.array([latency for latency, _ in values]) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (np.nan,) * 3
+        summary[endpoint] = dict(
+            requests=len(values),
+            errors=sum(not ok for _, ok in values),
+            throughput=len(values) / seconds,
+            p50=p50, p95=p95, p99=p99
+        )
+    return summary
+
+
+def run_scenario(server, upstream, scenario, users, duration, burst, think_time, expire_every):
+    stop = threading.Event()
+    clients = [User(server.url, scenario, stop, burst, think_time, seed=i) for i in range(users)]
+
+    def expire():
+        days = 0
+        while not stop.wait(expire_every):
+            days += 1
+            upstream.set_version(days)
+
+    started = time.perf_counter()
+    for client in clients:
+        client.start()
+    if scenario == 'expiry':
+        threading.Thread(target=expire, daemon=True).start()
+    time.sleep(duration)
+    stop.set()
+    for client in clients:
+        client.join()
+    seconds = time.perf_counter() - started
+
+    return summarize([sample for client in clients for sample in client.samples], seconds)
+
+
+def print_summary(title, summary):
+    print(title)
+    print(f'  {"endpoint":<22}{"requests":>9}{"errors":>8}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}')
+    for endpoint, s in summary.items():
+        print(f'  {endpoint:<22}{s["requests"]:>9}{s["errors"]:>8}{s["throughput"]:>9.1f}{s["p50"]:>9.1f}{s["p95"]:>9.1f}{s["p99"]:>9.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--users', type=int, default=16, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per scenario')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--burst', type=int, default=5, help='callbacks per radio-button burst')
+    parser.add_argument('--think-time', type=float, default=0.05, help='mean seconds between user actions')
+    parser.add_argument('--expire-every', type=float, default=5, help='seconds between new upstream versions (expiry scenario)')
+    parser.add_argument('--page', default=synthetic.FIXTURE, help='recorded upstream page')
+    parser.add_argument('--env', nargs='*', default=[], metavar='NAME=VALUE', help='app settings, e.g. SHARED_DATASET=1')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    with open(args.page, 'rb') as f:
+        upstream = Upstream(f.read())
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+
+    results = {}
+    try:
+        for workers in args.workers:
+            for threads in args.threads:
+                upstream.set_version(0)
+                server = Server(upstream.url, workers, threads, refresh_interval=args.expire_every,
+                                env=dict(setting.split('=', 1) for setting in args.env))
+                try:
+                    server.wait_ready()
+                    for scenario in args.scenarios:
+                        summary = run_scenario(server, upstream, scenario, args.users, args.duration,
+                                               args.burst, args.think_time, args.expire_every)
+                        key = f'{scenario}[workers={workers},threads={threads}]'
+                        results[key] = summary
+                        print_summary(key, summary)
+                finally:
+                    server.stop()
+    finally:
+        upstream.shutdown()
+
+    report = dict(run.environment(), settings=vars(args), upstream=upstream.counts, results=results)
+    output = args.output
+    if output is None:
+        os.makedirs(run.RESULTS_DIR, exist_ok=True)
+        output = os.path.join(run.RESULTS_DIR, f'loadtest-{(report["commit"] or "unknown")[:12]}{"-dirty" if report["dirty"] else ""}.json')
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results saved to {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+# Benchmark suite: ingestion, processing, snapshots and chart builders
+# Times every step of a refresh and every chart builder (including the
+# serialization) on synthetic data of 1 to 10+ years, and stores the results
+# with the commit and package versions as JSON, so runs of different commits
+# (or requirements) can be compared.
+# Usage:
+#   python benchmarks/run.py [--years 1 3 10] [--filter TEXT] [--output FILE]
+#   python benchmarks/run.py compare BASE.json NEW.json [--threshold 1.1]
+# Results are written to benchmarks/results/<commit>.json by default.
+import argparse
+import datetime
+import importlib.metadata
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+
+# Snapshots are saved to a temporary directory
+os.environ['SNAPSHOT_DIR'] = os.path.join(tempfile.mkdtemp(), 'snapshot')
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+import requests
+import data
+import extract
+import figcache
+import figjson
+import rolling
+import synthetic
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+PACKAGES = ['numpy', 'pandas', 'plotly', 'dash', 'flask', 'requests']
+
+# Benchmark name -> setup(years), which returns the function to time
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+# Transport adapter that answers every request with the given page (no network)
+class PageAdapter(requests.adapters.BaseAdapter):
+    def __init__(self, content):
+        super().__init__()
+        self.content = content
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = self.content
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def processed_data(years):
+    raw = synthetic.raw_data(years)
+    return dict(
+        df_daily_stats=data.process_daily_stats(raw['df_daily_stats']),
+        df_total_stats=data.process_total_stats(raw['df_total_stats'])
+    )
+
+
+# Ingestion
+
+@benchmark('ingest.extract_stats')
+def setup_extract_stats(years):
+    content = synthetic.page(years)
+    return lambda: extract.extract_stats(content)
+
+
+@benchmark('ingest.get_raw_data')
+def setup_get_raw_data(years):
+    data.session.mount(data.URL, PageAdapter(synthetic.page(years)))
+    return lambda: data.get_raw_data()
+
+
+# Processing
+
+@benchmark('process.daily_stats')
+def setup_process_daily_stats(years):
+    df = synthetic.raw_data(years)['df_daily_stats']
+    return lambda: data.process_daily_stats(df)
+
+
+@benchmark('process.daily_stats_incremental')
+def setup_process_daily_stats_incremental(years):
+    df = synthetic.raw_data(years)['df_daily_stats']
+    previous = data.process_daily_stats(df.iloc[:-1])
+    return lambda: data.process_daily_stats(df, previous=previous)
+
+
+@benchmark('process.total_stats')
+def setup_process_total_stats(years):
+    series = synthetic.raw_data(years)['df_total_stats']
+    return lambda: data.process_total_stats(series)
+
+
+@benchmark('process.rolling_stats_7')
+def setup_rolling_stats(years):
+    df = processed_data(years)['df_daily_stats']
+    return lambda: rolling.rolling_stats(df, 7)
+
+
+@benchmark('process.publish')
+def setup_publish(years):
+    dfs = processed_data(years)
+    return lambda: data.set_data(dfs)
+
+
+# Snapshots
+
+@benchmark('store.save_snapshot')
+def setup_save_snapshot(years):
+    dfs = processed_data(years)
+    return lambda: data.save_data(dfs)
+
+
+@benchmark('store.load_snapshot')
+def setup_load_snapshot(years):
+    data.save_data(processed_data(years))
+    return lambda: data.load_data_from_snapshot()
+
+
+# Charts (builder + serialization), one benchmark per chart and input
+
+def _register_chart(chart, input):
+    @benchmark(f'charts.{chart}.{input}' if input is not None else f'charts.{chart}')
+    def setup_chart(years):
+        ds = data.set_data(processed_data(years))
+        builder, _ = figcache.CHARTS[chart]
+        return lambda: figjson.to_json(builder(input, ds))
+
+
+for _chart, (_, _inputs) in figcache.CHARTS.items():
+    for _input in _inputs:
+        _register_chart(_chart, _input)
+
+
+# Time a function: the number of calls per repeat is chosen so that a repeat takes about min_time seconds
+def measure(func, repeat=5, min_time=0.2):
+    func()
+    number = 1
+    while True:
+        seconds = timeit.timeit(func, number=number)
+        if seconds >= min_time or number >= 10 ** 6:
+            break
+        number = max(number * 2, int(number * min_time / max(seconds, 1e-9)))
+
+    times = [seconds / number for seconds in timeit.repeat(func, number=number, repeat=repeat)]
+    return dict(min=min(times), median=statistics.median(times), number=number, repeat=repeat)
+
+
+def git(*args):
+    try:
+        return subprocess.check_output(['git', *args], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+
+    return dict(
+        commit=git('rev-parse', 'HEAD'),
+        dirty=bool(git('status', '--porcelain', '--untracked-files=no')),
+        created=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        python=platform.python_version(),
+        machine=platform.platform(),
+        packages=versions
+    )
+
+
+def run(years, filter=None, output=None):
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if filter and filter not in name:
+            continue
+        for y in years:
+            key = f'{name}[years={y}]'
+            result = results[key] = measure(setup(y))
+            print(f'{key:<52} {result["min"] * 1000:10.3f} ms (median {result["median"] * 1000:.3f} ms)')
+
+    report = dict(environment(), results=results)
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f'{(report["commit"] or "unknown")[:12]}{"-dirty" if report["dirty"] else ""}.json')
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results saved to {output}')
+
+
+# Compare two result files (best times), returns True if nothing is slower than threshold
+def compare(base_file, new_file, threshold=1.1):
+    with open(base_file) as f:
+        base = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+
+    print(f'base {base["commit"]} ({base["packages"]})')
+    print(f'new  {new["commit"]} ({new["packages"]})')
+
+    regressions = 0
+    for key in sorted(base['results'].keys() & new['results'].keys()):
+        before, after = base['results'][key]['min'], new['results'][key]['min']
+        ratio = after / before
+        mark = 'slower' if ratio > threshold else 'faster' if ratio < 1 / threshold else ''
+        regressions += mark == 'slower'
+        print(f'{key:<52} {before * 1000:10.3f} ms {after * 1000:10.3f} ms {ratio:6.2f}x {mark}')
+
+    for key in sorted(base['results'].keys() ^ new['results'].keys()):
+        print(f'{key:<52} only in {"base" if key in base["results"] else "new"}')
+
+    return regressions == 0
+
+
+def main():
+    if sys.argv[1:2] == ['compare']:
+        parser = argparse.ArgumentParser(prog='run.py compare')
+        parser.add_argument('base')
+        parser.add_argument('new')
+        parser.add_argument('--threshold', type=float, default=1.1)
+        args = parser.parse_args(sys.argv[2:])
+        sys.exit(0 if compare(args.base, args.new, args.threshold) else 1)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=float, nargs='+', default=[1, 3, 10])
+    parser.add_argument('--filter')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    run([int(y) if y == int(y) else y for y in args.years], args.filter, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# Synthetic raw data with the same structure as the innews page data
+import datetime
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+
+
+START_DATE = datetime.date(2020, 2, 26)
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'innews.html')
+
+CATEGORIES = ['cases', 'deceased', 'intubated']
+AGES = ['0_17', '18_39', '40_64', '65plus']
+GENDERS = ['male', 'female']
+
+
+# Raw daily stats for the given number of days (as returned by data.get_raw_data)
+# Total tests occasionally decrease, as in the real data.
+def daily_stats(days, seed=0):
+    rng = np.random.default_rng(seed)
+
+    cases = rng.integers(0, 5000, days)
+    deceased = rng.integers(0, 80, days)
+    total_tests = np.cumsum(rng.integers(0, 30000, days))
+    total_rapid_tests = np.cumsum(rng.integers(0, 80000, days))
+    corrections = rng.random(days) < 0.01
+    total_tests[corrections] -= 50000
+    total_rapid_tests[corrections] -= 100000
+
+    return pd.DataFrame(dict(
+        date=[(START_DATE + datetime.timedelta(days=i)).isoformat() for i in range(days)],
+        cases=cases,
+        total_cases=np.cumsum(cases),
+        deceased=deceased,
+        total_deceased=np.cumsum(deceased),
+        intubated=rng.integers(0, 800, days),
+        total_tests=total_tests,
+        total_rapid_tests=total_rapid_tests
+    ))
+
+
+# Raw n-day average stats (as the scraped three_days_stats and weekly_stats)
+def average_stats(df_daily_stats, days):
+    df = df_daily_stats[['cases', 'deceased', 'intubated']].rolling(days).mean().round(2)
+    df.insert(0, 'date', df_daily_stats['date'])
+    return df.iloc[days - 1:].reset_index(drop=True)
+
+
+# Raw total stats (as returned by data.get_raw_data)
+def total_stats(seed=0, date=None):
+    rng = np.random.default_rng(seed)
+
+    stats = {'id': 1, 'date': date or START_DATE.isoformat(), 'created_at': '', 'updated_at': ''}
+    for cat in CATEGORIES:
+        for age in AGES:
+            for gender in GENDERS:
+                stats[f'{cat}_{age}_{gender}'] = str(rng.integers(1, 100000))
+
+    return pd.Series(stats)
+
+
+# Raw data for the given number of years (as returned by data.get_raw_data)
+def raw_data(years=1, seed=0):
+    df_daily_stats = daily_stats(int(years * 365), seed=seed)
+    return dict(
+        df_daily_stats=df_daily_stats,
+        df_three_days_stats=average_stats(df_daily_stats, 3),
+        df_weekly_stats=average_stats(df_daily_stats, 7),
+        df_total_stats=total_stats(seed=seed, date=df_daily_stats['date'].iloc[-1])
+    )
+
+
+# innews page (bytes) with synthetic data for the given number of years
+# (the saved page fixture with the values of its stats variables replaced)
+def page(years=1, seed=0):
+    raw = raw_data(years, seed=seed)
+    stats = dict(
+        daily_stats=raw['df_daily_stats'].to_dict(orient='records'),
+        weekly_stats=raw['df_weekly_stats'].to_dict(orient='records'),
+        three_days_stats=raw['df_three_days_stats'].to_dict(orient='records'),
+        last_stats=raw['df_daily_stats'].iloc[-1].to_dict(),
+        total_stats=raw['df_total_stats'].to_dict()
+    )
+
+    with open(FIXTURE) as f:
+        text = f.read()
+    for name, value in stats.items():
+        text = re.sub(rf'(var {name} = ).*;', lambda m: m.group(1) + json.dumps(value) + ';', text)
+
+    return text.encode()
@@ -0,0 +1,91 @@
+import os
+import random
+import threading
+import time
+
+
+# Circuit breaker of the upstream page requests
+#
+# After BREAKER_FAILURES consecutive failed fetches the circuit opens: no
+# requests are sent to the upstream site, and the last good data is kept
+# (readers keep getting the current in-memory dataset, without any I/O).
+# The circuit stays open for an exponential backoff with jitter
+# (BREAKER_BACKOFF, doubled after each failed trial, up to
+# BREAKER_MAX_BACKOFF seconds), then one trial request is allowed
+# (half-open): if it succeeds the circuit closes, otherwise it opens again
+# for the next backoff.
+
+BREAKER_FAILURES = int(os.environ.get('BREAKER_FAILURES', 3))
+BREAKER_BACKOFF = float(os.environ.get('BREAKER_BACKOFF', 300))
+BREAKER_MAX_BACKOFF = float(os.environ.get('BREAKER_MAX_BACKOFF', 3600))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# Jitter added to each open duration: up to 10% of BREAKER_BACKOFF
+BREAKER_JITTER = BREAKER_BACKOFF / 10
+
+
+# Open duration after a failed trial: BREAKER_BACKOFF * 2 ** (trial - 1), capped, plus jitter
+def backoff(trial):
+    return min(BREAKER_BACKOFF * 2 ** min(trial - 1, 32), BREAKER_MAX_BACKOFF) + random.uniform(0, BREAKER_JITTER)
+
+
+_lock = threading.Lock()
+
+# State of the circuit
+# opened: times the circuit opened, rejected: fetches not sent while it was open
+status = dict(
+    state=CLOSED,
+    consecutive_failures=0,
+    retry_at=None,
+    opened=0,
+    rejected=0
+)
+
+# Failed trials since the circuit opened (exponent of the backoff)
+_trials = 0
+
+
+# Whether a request may be sent to the upstream site
+# When the backoff has elapsed, the circuit is half-open and the request is a trial.
+def allow():
+    with _lock:
+        if status['state'] == OPEN and time.time() >= status['retry_at']:
+            status['state'] = HALF_OPEN
+        if status['state'] == OPEN:
+            status['rejected'] += 1
+            return False
+        return True
+
+
+def record_success():
+    global _trials
+
+    with _lock:
+        if status['state'] != CLOSED:
+            print('Upstream circuit closed.')
+        status.update(state=CLOSED, consecutive_failures=0, retry_at=None)
+        _trials = 0
+
+
+def record_failure():
+    global _trials
+
+    with _lock:
+        status['consecutive_failures'] += 1
+        if status['state'] == CLOSED and status['consecutive_failures'] < BREAKER_FAILURES:
+            return
+
+        if status['state'] == CLOSED:
+            status['opened'] += 1
+        _trials += 1
+        delay = backoff(_trials)
+        status.update(state=OPEN, retry_at=time.time() + delay)
+        print(f'Upstream circuit open after {status["consecutive_failures"]} consecutive failures, next trial in {delay:.0f}s.')
+
+
+# 0: closed, 1: half-open, 2: open (for monitoring)
+def state_code():
+    return [CLOSED, HALF_OPEN, OPEN].index(status['state'])
@@ -0,0 +1,444 @@
+import ast
+import glob
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import brotli
+import flask
+
+try:
+    from fontTools import subset
+except ImportError:  # fonttools not installed: fonts are not subset
+    subset = None
+
+
+# Bundle of the stylesheets and fonts of the assets folder
+#
+# The stylesheets of assets/ (Font Awesome, SB Admin 2 / Bootstrap and the
+# app styles) are bundled into one stylesheet with only the rules whose
+# classes are used: the classes in the string literals of USED_CLASS_SOURCES
+# (a literal ending with '-' is a prefix, e.g. "text-" + info_type), and the
+# classes rendered by the Dash Bootstrap components (SAFELIST). Icon fonts
+# are subset to the icons of the remaining rules, and @font-face and
+# @keyframes rules that are no longer referenced are removed.
+#
+# The files are written to BUNDLE_DIR with their content hash in their name,
+# with gzip and brotli encodings of the stylesheet, and served from memory on
+# BUNDLE_PATH with immutable cache headers (a changed file gets a new name).
+# The bundle is built by python bundle.py, a build step of the deployment
+# (bin/post_compile), not by the app: at startup the app only reads the
+# manifest, and serves the assets as they are if there is no bundle or if it
+# is out of date (hash of the assets, of the class sources and of this
+# module, in the manifest). ASSET_BUNDLE=0 serves the assets as they are.
+#
+# Usage: python bundle.py (builds the bundle and prints the bytes saved)
+
+ASSET_BUNDLE = os.environ.get('ASSET_BUNDLE', '1') not in ('', '0', 'false', 'False')
+BUNDLE_DIR = os.environ.get('BUNDLE_DIR', 'build/assets')
+BUNDLE_PATH = '/bundle/'
+MANIFEST_FILE = 'manifest.json'
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.join(ROOT, 'assets')
+
+# Stylesheets of assets/ in the bundle (in Dash order), the others are ignored
+STYLESHEETS = ['11-fa-all.css', '20-sb-admin-2.css', '30-styles.css']
+
+# Modules whose string literals are the class names used by the app
+USED_CLASS_SOURCES = ['app.py', 'cards.py']
+
+# Classes rendered by the Dash Bootstrap components of the layout
+SAFELIST = [
+    r'navbar(-.+)?', r'fixed-(top|bottom)', r'bg-primary',
+    r'container(-.+)?', r'row', r'col(-.+)?',
+    r'card(-.+)?',
+    r'btn', r'btn-danger', r'btn-close', r'close',
+    r'modal(-.+)?', r'fade', r'show',
+]
+
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+MIMETYPES = {
+    '.css': 'text/css; charset=utf-8',
+    '.woff2': 'font/woff2',
+}
+
+# File name suffixes of the pre-compressed encodings
+ENCODINGS = {'br': 'br', 'gzip': 'gz'}
+
+# At-rules that contain rules (the others contain declarations)
+NESTED_AT_RULES = ('@media', '@supports', '@document', '@keyframes', '@-webkit-keyframes')
+
+# First paint estimate: network of Lighthouse mobile (slow 4G)
+FIRST_PAINT_BANDWIDTH = 1.6e6 / 8
+FIRST_PAINT_RTT = 0.15
+
+
+def _hash(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part)
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+# Hash of everything the bundle is built from
+def source_hash():
+    paths = [os.path.join(ASSETS_DIR, name) for name in STYLESHEETS]
+    paths += sorted(glob.glob(os.path.join(ASSETS_DIR, 'webfonts', '*')))
+    paths += [os.path.join(ROOT, name) for name in USED_CLASS_SOURCES] + [os.path.abspath(__file__)]
+    contents = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            contents.append(f.read())
+    return _hash(*contents, *(pattern.encode() for pattern in SAFELIST))[:16]
+
+
+# CSS parsing
+
+# Read from pos up to one of the terminators (outside of strings and parentheses)
+# Returns (text, position after the terminator, terminator or None at the end)
+def _read_until(css, pos, terminators):
+    start = pos
+    depth = 0
+    while pos < len(css):
+        c = css[pos]
+        if c in '"\'':
+            pos += 1
+            while pos < len(css) and css[pos] != c:
+                pos += 2 if css[pos] == '\\' else 1
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif depth == 0 and c in terminators:
+            return css[start:pos], pos + 1, c
+        pos += 1
+    return css[start:], pos, None
+
+
+# Parse a stylesheet (without comments) into items:
+# ('statement', text), ('rule', prelude, declarations), ('block', prelude, items)
+def _parse(css, pos=0):
+    items = []
+    while True:
+        while pos < len(css) and css[pos].isspace():
+            pos += 1
+        if pos >= len(css):
+            return items, pos
+        if css[pos] == '}':
+            return items, pos + 1
+
+        prelude, pos, terminator = _read_until(css, pos, '{;}')
+        prelude = ' '.join(prelude.split())
+        if terminator != '{':
+            if prelude:
+                items.append(('statement', prelude))
+            if terminator == '}':
+                return items, pos
+        elif prelude.startswith(NESTED_AT_RULES):
+            body, pos = _parse(css, pos)
+            items.append(('block', prelude, body))
+        else:
+            declarations, pos, _ = _read_until(css, pos, '}')
+            items.append(('rule', prelude, ' '.join(declarations.split())))
+
+
+def _serialize(items):
+    parts = []
+    for item in items:
+        if item[0] == 'statement':
+            parts.append(item[1] + ';')
+        elif item[0] == 'rule':
+            parts.append(f'{item[1]}{{{item[2]}}}')
+        else:
+            parts.append(f'{item[1]}{{{_serialize(item[2])}}}')
+    return '\n'.join(parts)
+
+
+def _split_selectors(prelude):
+    selectors = []
+    pos = 0
+    while pos < len(prelude):
+        selector, pos, _ = _read_until(prelude, pos, ',')
+        selectors.append(selector.strip())
+    return selectors
+
+
+# Classes of a selector that must be present for it to match (not the ones in :not() or attribute values)
+def _selector_classes(selector):
+    selector = re.sub(r'\[[^\]]*\]', '', selector)
+    selector = re.sub(r':not\([^()]*\)', '', selector)
+    return re.findall(r'\.(-?[_a-zA-Z][\w-]*)', selector)
+
+
+# Purging
+
+# Class names (and class name prefixes) in the string literals of the sources
+def used_classes(sources=None):
+    classes = set()
+    for name in sources or USED_CLASS_SOURCES:
+        with open(os.path.join(ROOT, name)) as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str):
+                classes.update(token for token in node.value.split() if re.fullmatch(r'-?[_a-zA-Z][\w-]*', token))
+    return classes
+
+
+# Function telling whether a class is used
+def class_filter(classes, safelist=SAFELIST):
+    prefixes = [token for token in classes if token.endswith('-')]
+    safelist = re.compile('|'.join(f'(?:{pattern})' for pattern in safelist))
+
+    def is_used(name):
+        return (
+            name in classes
+            or safelist.fullmatch(name) is not None
+            or any(name.startswith(prefix) and name[len(prefix):] in classes for prefix in prefixes)
+        )
+    return is_used
+
+
+def _purge_rules(items, is_used):
+    kept = []
+    for item in items:
+        if item[0] == 'block':
+            body = item[2] if item[1].startswith(('@keyframes', '@-webkit-keyframes')) else _purge_rules(item[2], is_used)
+            if body:
+                kept.append(('block', item[1], body))
+        elif item[0] == 'rule' and not item[1].startswith('@'):
+            selectors = [s for s in _split_selectors(item[1]) if all(map(is_used, _selector_classes(s)))]
+            if selectors:
+                kept.append(('rule', ','.join(selectors), item[2]))
+        else:
+            kept.append(item)
+    return kept
+
+
+def _declarations(items):
+    for item in items:
+        if item[0] == 'block':
+            yield from _declarations(item[2])
+        elif item[0] == 'rule' and not item[1].startswith('@'):
+            yield item[2]
+
+
+# Remove @keyframes and @font-face rules that are not referenced by the remaining rules
+def _purge_at_rules(items, referenced):
+    kept = []
+    for item in items:
+        if item[0] == 'block' and item[1].startswith(('@keyframes', '@-webkit-keyframes')):
+            if item[1].split()[1] in referenced:
+                kept.append(item)
+        elif item[0] == 'block':
+            body = _purge_at_rules(item[2], referenced)
+            if body:
+                kept.append(('block', item[1], body))
+        elif item[0] == 'rule' and item[1] == '@font-face':
+            family = re.search(r'font-family:\s*(["\']?)([^;"\']+)\1', item[2]).group(2)
+            if family in referenced:
+                kept.append(item)
+        else:
+            kept.append(item)
+    return kept
+
+
+# Stylesheet with only the used rules
+def purge(css, is_used):
+    license_comments = re.findall(r'/\*!.*?\*/', css, flags=re.S)
+    items, _ = _parse(re.sub(r'/\*.*?\*/', '', css, flags=re.S))
+    items = _purge_rules(items, is_used)
+    items = _purge_at_rules(items, ' '.join(_declarations(items)))
+    return '\n'.join(license_comments + [_serialize(items)]) + '\n'
+
+
+# Code points of the icons (content of ::before rules) of a stylesheet
+def icon_codepoints(css):
+    return sorted({int(code, 16) for code in re.findall(r'::?before\{[^}]*content:\s*"\\([0-9a-fA-F]{4,5})"', css)})
+
+
+# Font (TrueType) with only the glyphs of the given code points, as woff2
+def subset_font(content, codepoints):
+    options = subset.Options()
+    options.flavor = 'woff2'
+    options.layout_features = []
+    font = subset.load_font(io.BytesIO(content), options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=codepoints)
+    subsetter.subset(font)
+    output = io.BytesIO()
+    subset.save_font(font, output, options)
+    return output.getvalue()
+
+
+# Building
+
+def _fingerprinted(name, content):
+    root, ext = os.path.splitext(name)
+    return f'{root}.{_hash(content)[:12]}{ext}'
+
+
+def _write(directory, name, content):
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+def _first_paint(css_sizes, font_sizes):
+    # Stylesheets are render-blocking and loaded in parallel, then the icon font (font-display: block)
+    seconds = FIRST_PAINT_RTT + sum(css_sizes) / FIRST_PAINT_BANDWIDTH
+    if font_sizes:
+        seconds += FIRST_PAINT_RTT + sum(font_sizes) / FIRST_PAINT_BANDWIDTH
+    return seconds
+
+
+# Build the bundle in directory, returns its manifest
+def build(directory=BUNDLE_DIR):
+    os.makedirs(directory, exist_ok=True)
+    is_used = class_filter(used_classes())
+
+    stylesheets = []
+    for name in STYLESHEETS:
+        with open(os.path.join(ASSETS_DIR, name)) as f:
+            stylesheets.append(purge(f.read(), is_used))
+    css = '\n'.join(stylesheets)
+
+    # Fonts of the remaining @font-face rules, subset to the remaining icons, served as woff2 only
+    codepoints = icon_codepoints(css)
+    files = {}
+    fonts = {}
+    for source in sorted(set(re.findall(r'url\("?webfonts/([\w-]+)\.woff2"?\)', css))):
+        with open(os.path.join(ASSETS_DIR, 'webfonts', source + '.woff2'), 'rb') as f:
+            content = f.read()
+        if subset is None:
+            font = content
+        else:
+            with open(os.path.join(ASSETS_DIR, 'webfonts', source + '.ttf'), 'rb') as f:
+                ttf = f.read()
+            # Fonts without any of the icons are not needed
+            if not set(codepoints) & set(subset.load_font(io.BytesIO(ttf), subset.Options()).getBestCmap()):
+                css = re.sub(rf'@font-face\{{[^}}]*webfonts/{source}\.woff2[^}}]*\}}\n?', '', css)
+                continue
+            font = subset_font(ttf, codepoints)
+        name = _fingerprinted(source + '.woff2', font)
+        _write(directory, name, font)
+        files[name] = dict(size=len(font))
+        fonts[source] = dict(name=name, source_size=len(content), size=len(font))
+    css = re.sub(
+        r'src:\s*url\("?webfonts/([\w-]+)\.woff2"?\)[^;}]*',
+        lambda match: f'src:url("{fonts[match.group(1)]["name"]}") format("woff2")',
+        css
+    )
+
+    content = css.encode()
+    name = _fingerprinted('bundle.css', content)
+    encodings = dict(gzip=gzip.compress(content, compresslevel=9, mtime=0), br=brotli.compress(content, quality=11))
+    _write(directory, name, content)
+    for encoding, value in encodings.items():
+        _write(directory, f'{name}.{ENCODINGS[encoding]}', value)
+    files[name] = dict(size=len(content), **{encoding: len(value) for encoding, value in encodings.items()})
+
+    source_sizes = [os.path.getsize(os.path.join(ASSETS_DIR, source)) for source in STYLESHEETS]
+    # Font of the icons: the one with the largest subset (the others have none of their glyphs)
+    icon_font = max(fonts.values(), key=lambda font: font['size'], default=None)
+    report = dict(
+        stylesheets=dict(source=sum(source_sizes), purged=len(content), br=files[name]['br'], gzip=files[name]['gzip']),
+        fonts={source: dict(source=font['source_size'], subset=font['size']) for source, font in fonts.items()},
+        icons=len(codepoints),
+        # Render-blocking stylesheets (Dash serves assets uncompressed) and the icon font
+        first_paint=dict(
+            before=_first_paint(source_sizes, [icon_font['source_size']] if icon_font else []),
+            after=_first_paint([files[name]['br']], [icon_font['size']] if icon_font else [])
+        )
+    )
+
+    manifest = dict(source_hash=source_hash(), stylesheet=name, files=files, report=report)
+    tmp_path = os.path.join(directory, f'{MANIFEST_FILE}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(directory, MANIFEST_FILE))
+    return manifest
+
+
+# Manifest of the bundle built by python bundle.py (None if disabled, missing or out of date)
+# The bundle is not built here: workers only read it, and serve the assets as
+# they are without it.
+def load(directory=BUNDLE_DIR):
+    if not ASSET_BUNDLE:
+        return None
+
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        if manifest['source_hash'] == source_hash():
+            return manifest
+        print('The asset bundle is out of date (run python bundle.py), serving the assets as they are')
+    except (FileNotFoundError, ValueError, KeyError):
+        print('No asset bundle (run python bundle.py), serving the assets as they are')
+    return None
+
+
+def format_report(report):
+    stylesheets = report['stylesheets']
+    lines = [
+        f'stylesheets {stylesheets["source"] / 1024:.1f} KiB -> {stylesheets["purged"] / 1024:.1f} KiB purged, '
+        f'{stylesheets["br"] / 1024:.1f} KiB brotli, {stylesheets["gzip"] / 1024:.1f} KiB gzip '
+        f'({stylesheets["source"] - stylesheets["br"]:,} bytes saved)'
+    ]
+    for source, font in report['fonts'].items():
+        lines.append(f'font {source}: {font["source"] / 1024:.1f} KiB -> {font["subset"] / 1024:.1f} KiB '
+                     f'({font["source"] - font["subset"]:,} bytes saved)')
+    lines.append(f'{report["icons"]} icons')
+    lines.append(f'first paint (estimate, {FIRST_PAINT_BANDWIDTH * 8 / 1e6:.1f} Mbps, {FIRST_PAINT_RTT * 1000:.0f} ms RTT): '
+                 f'{report["first_paint"]["before"] * 1000:.0f} ms -> {report["first_paint"]["after"] * 1000:.0f} ms')
+    return '\n'.join(lines)
+
+
+# Dash settings: assets to ignore (the bundled stylesheets, if there is a bundle) and external stylesheets
+def dash_options(manifest, assets_ignore):
+    if manifest is None:
+        return dict(assets_ignore=assets_ignore)
+    bundled = '|'.join(re.escape(name) for name in STYLESHEETS)
+    return dict(
+        assets_ignore=f'{assets_ignore}|{bundled}',
+        external_stylesheets=[BUNDLE_PATH + manifest['stylesheet']]
+    )
+
+
+# Serve the files of the bundle on BUNDLE_PATH (from memory, pre-compressed, immutable)
+def init_app(server, manifest, directory=BUNDLE_DIR):
+    if manifest is None:
+        return
+
+    files = {}
+    for name, info in manifest['files'].items():
+        files[name] = {}
+        for encoding in [None] + [encoding for encoding in ENCODINGS if encoding in info]:
+            with open(os.path.join(directory, f'{name}.{ENCODINGS[encoding]}' if encoding else name), 'rb') as f:
+                files[name][encoding] = f.read()
+
+    @server.route(BUNDLE_PATH + '<name>')
+    def serve_bundle(name):
+        encodings = files.get(name)
+        if encodings is None:
+            flask.abort(404)
+
+        encoding = next((e for e in ENCODINGS if e in encodings and flask.request.accept_encodings[e]), None)
+        response = flask.Response(encodings[encoding], content_type=MIMETYPES[os.path.splitext(name)[1]])
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        if len(encodings) > 1:
+            response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = CACHE_CONTROL
+        return response
+
+
+if __name__ == '__main__':
+    print(format_report(build()['report']))
@@ -1,191 +1,394 @@
 import pandas as pd
 import numpy as np
 import requests
-import bs4
-import re
 import json
+import hashlib
+import time
+import os
+import extract
+import store
+import dataset
+import metrics
+import breaker
+import archive
+import revisions
 
+# Export processed data as csv files in data/ whenever it is saved
+EXPORT_CSV = os.environ.get('EXPORT_CSV', '') not in ('', '0', 'false', 'False')
 
-df_daily_stats = None
-df_three_days_stats = None
-df_weekly_stats = None
-df_total_stats = None
+# Names of the processed data in saved snapshots and csv exports
+SAVED_DATA_NAMES = dict(
+    df_daily_stats = 'daily_stats',
+    df_total_stats = 'total_stats'
+)
 
-# Load data from csv files
-def load_data_from_csv():
-    return dict(
-        df_daily_stats = pd.read_csv('data/daily_stats.csv'),
-        df_three_days_stats = pd.read_csv('data/three_days_stats.csv'),
-        df_weekly_stats = pd.read_csv('data/weekly_stats.csv'),
-        df_total_stats = pd.read_csv('data/total_stats.csv')
-    )
 
+# Path of the saved snapshot published as the current dataset (None if the
+# current dataset was not published from a snapshot)
+published_snapshot = None
+
+
+# Load data from the saved snapshot
+# Returns (snapshot manifest, data), or (None, None) if there is no saved snapshot
+def load_data_from_snapshot():
+    manifest, frames = store.load_snapshot()
+    if manifest is None:
+        return None, None
+
+    return manifest, {key: frames[name] for key, name in SAVED_DATA_NAMES.items()}
+
+
+# Save data as a new snapshot (and export csv files, if enabled)
+# Returns the version of the new snapshot
+def save_data(dfs):
+    frames = {name: dfs[key] for key, name in SAVED_DATA_NAMES.items()}
+    manifest = store.save_snapshot(frames)
+
+    if EXPORT_CSV:
+        store.export_csv(frames)
+
+    return manifest['version']
 
-# Extract new raw data from webpage
-def get_raw_data(save=False):
 
-    URL = 'https://covid19.innews.gr/'
+# Upstream page (UPSTREAM_URL: e.g. a local stand-in for load tests)
+URL = os.environ.get('UPSTREAM_URL', 'https://covid19.innews.gr/')
+
+# Returned by get_raw_data when the upstream data has not changed since the last fetch
+NOT_MODIFIED = 'not-modified'
+
+# Persistent HTTP session, reused by all fetches (connection pooling)
+session = requests.Session()
+
+# Validators of the last processed fetch
+fetch_validators = dict(
+    etag=None,
+    last_modified=None,
+    payload_hash=None
+)
+
+# Fetch counters
+# hits: fetches short-circuited by a 304 or an unchanged payload hash
+# misses: fetches with changed data that had to be parsed and processed
+fetch_stats = dict(
+    requests=0,
+    hits=0,
+    misses=0,
+    not_modified=0,
+    unchanged=0,
+    errors=0
+)
+
+
+# Extract new raw data from webpage
+# If conditional is True, the request is sent with the validators of the last
+# processed fetch, and NOT_MODIFIED is returned when the server answers with
+# 304 or when the extracted data has the same hash as the last processed data.
+def get_raw_data(timeout=None, conditional=False):
+
+    headers = {}
+    if conditional:
+        if fetch_validators['etag']:
+            headers['If-None-Match'] = fetch_validators['etag']
+        if fetch_validators['last_modified']:
+            headers['If-Modified-Since'] = fetch_validators['last_modified']
 
     try:
-        r = requests.get(URL)
-    
+        fetch_stats['requests'] += 1
+        with metrics.FETCH_DURATION.time():
+            r = session.get(URL, headers=headers, timeout=timeout)
+
+        if conditional and r.status_code == 304:
+            fetch_stats['hits'] += 1
+            fetch_stats['not_modified'] += 1
+            return NOT_MODIFIED
+
         if r.status_code != 200:
+            fetch_stats['errors'] += 1
             return None
     
-        # Load response to BeautifulSoup
-        soup = bs4.BeautifulSoup(r.text, 'html.parser')  
+        metrics.FETCH_BYTES.observe(len(r.content))
+        parse_started = time.perf_counter()
+
+        # Extract raw stats (JSON) from the script that contains the required data
+        raw_stats = extract.extract_stats(r.content)
 
-        # Find script tag that contains the required data      
-        script_tag = soup.find_all('script')[2]
+        # Skip parsing and processing if the extracted data has not changed
+        payload_hash = hashlib.sha256(b'\n'.join(
+            raw_stats[name] for name in extract.REQUIRED_STATS
+        )).hexdigest()
+
+        validators = dict(
+            etag=r.headers.get('ETag'),
+            last_modified=r.headers.get('Last-Modified'),
+            payload_hash=payload_hash
+        )
+
+        if conditional and payload_hash == fetch_validators['payload_hash']:
+            fetch_validators.update(validators)
+            fetch_stats['hits'] += 1
+            fetch_stats['unchanged'] += 1
+            return NOT_MODIFIED
+
+        fetch_stats['misses'] += 1
 
         # Extract daily_stats
-        m = re.search("var daily_stats = (\[.*\])", script_tag.string)
-        daily_stats = json.loads(m.group(1))
+        daily_stats = json.loads(raw_stats['daily_stats'])
         df_daily_stats = pd.DataFrame.from_records(daily_stats)
 
-        # Extract weekly_stats
-        m = re.search("var weekly_stats = (\[.*\])", script_tag.string)
-        weekly_stats = json.loads(m.group(1))
-        df_weekly_stats = pd.DataFrame.from_records(weekly_stats)
-
-        # Extract three_days_stats
-        m = re.search("var three_days_stats = (\[.*\])", script_tag.string)
-        three_days_stats = json.loads(m.group(1))
-        df_three_days_stats = pd.DataFrame.from_records(three_days_stats)
+        # weekly_stats and three_days_stats are not used (calculated from daily_stats, see rolling)
 
         # Extract last_stats
-        # m = re.search("var last_stats = (\{.*\})", script_tag.string)
-        # last_stats = json.loads(m.group(1))
+        # last_stats = json.loads(raw_stats['last_stats'])
         # series_last_stats = pd.Series(last_stats)
 
         # Extract total_stats
-        m = re.search("var total_stats = (\{.*\})", script_tag.string)
-        total_stats = json.loads(m.group(1))
+        total_stats = json.loads(raw_stats['total_stats'])
         series_total_stats = pd.Series(total_stats)
 
-        if save:
-            df_daily_stats.to_csv('data/daily_stats-raw.csv', index=False)
-            df_three_days_stats.to_csv('data/three_days_stats-raw.csv', index=False)
-            df_weekly_stats.to_csv('data/weekly_stats-raw.csv', index=False)
-            series_total_stats.to_csv('data/total_stats-raw.csv', index=False)
+        metrics.PARSE_DURATION.observe(time.perf_counter() - parse_started)
 
         return dict(
             df_daily_stats = df_daily_stats,
-            df_three_days_stats = df_three_days_stats,
-            df_weekly_stats = df_weekly_stats,
-            df_total_stats = series_total_stats
+            df_total_stats = series_total_stats,
+            validators = validators
         )
     
     except Exception as err:
+        fetch_stats['errors'] += 1
         print(f'Error occurred: {err}')
         return None
 
 
-# Process daily stats
-def process_daily_stats(df, save=False):
-    df_daily_stats = df.copy()
-    
-    # Cummulative sums for daily stats
-    df_daily_stats['calculated_cases_cumsum'] = df_daily_stats['cases'].cumsum()
-    df_daily_stats['calculated_deceased_cumsum'] = df_daily_stats['deceased'].cumsum()
-
-    # Daily PCR tests
-    series_tests_pcr = df_daily_stats['total_tests'].diff()
-    series_tests_pcr[0] = df_daily_stats['total_tests'].iloc[0]
-    series_tests_pcr = series_tests_pcr.astype(int)
-    # Set daily PCR tests value equal to the previous day where there are negative differences
-    series_tests_pcr[series_tests_pcr<0] = np.nan
-    series_tests_pcr.ffill(inplace=True)
-    
-    # Daily rapid tests
-    series_tests_rapid = df_daily_stats['total_rapid_tests'].diff()
-    series_tests_rapid[0] = df_daily_stats['total_rapid_tests'].iloc[0]
-    series_tests_rapid = series_tests_rapid.astype(int)
-    # Set daily rapid tests value equal to the previous day where there are negative differences
-    series_tests_rapid[series_tests_rapid<0] = np.nan
-    series_tests_rapid.ffill(inplace=True)
+# Columns added to the daily stats by process_daily_stats
+DAILY_CALCULATED_COLUMNS = [
+    'calculated_cases_cumsum',
+    'calculated_deceased_cumsum',
+    'calculated_tests_pcr',
+    'calculated_tests_rapid',
+    'calculated_tests_total',
+    'calculated_positivity',
+    'calculated_fatality'
+]
 
-    # Add calculated daily tests (PCR, rapid, total) to df_daily_stats
-    df_daily_stats['calculated_tests_pcr'] = series_tests_pcr.astype(int)
-    df_daily_stats['calculated_tests_rapid'] = series_tests_rapid.astype(int)
-    df_daily_stats['calculated_tests_total'] = df_daily_stats['calculated_tests_pcr'] + df_daily_stats['calculated_tests_rapid']
 
-    # Daily positivity rate
-    df_daily_stats['calculated_positivity'] = df_daily_stats['cases'] / df_daily_stats['calculated_tests_total'] * 100
+# Daily tests from total tests
+# last_total_tests and last_daily_tests are the values of the day before the first value of total_tests
+def _calculate_daily_tests(total_tests, last_total_tests=0, last_daily_tests=np.nan):
+    series_tests = np.diff(total_tests, prepend=last_total_tests)
 
-    # Fatality rate (data up to current day)
-    df_daily_stats['calculated_fatality'] = df_daily_stats['calculated_deceased_cumsum'] / df_daily_stats['calculated_cases_cumsum'] * 100
+    # Set daily tests value equal to the previous day where there are negative differences
+    valid = series_tests >= 0
+    if not valid.all():
+        series_tests = np.concatenate([[last_daily_tests], series_tests])
+        last_valid = np.where(np.concatenate([[True], valid]), np.arange(len(series_tests)), 0)
+        np.maximum.accumulate(last_valid, out=last_valid)
+        series_tests = series_tests[last_valid][1:]
 
-    if save:
-        df_daily_stats.to_csv('data/daily_stats.csv', index=False)
+    return series_tests.astype(int)
 
-    return df_daily_stats
 
+# Calculate the daily stats columns
+# raw is a dict of the raw daily stats columns (arrays) and last a dict of the
+# processed values of the day before the first row (None for the whole
+# history), used to carry over the running sums and the last valid daily test counts
+def _calculate_daily_stats(raw, last=None):
+    calculated = {}
 
-# Process total stats
-def process_total_stats(series, save=False):
-    # Create total stats dataframe from series
-    df_total_stats = pd.DataFrame(series)
-    df_total_stats.rename(columns={0: 'value'}, inplace=True)
-    df_total_stats.drop(['id','date','created_at', 'updated_at'], inplace=True)
-    df_total_stats.reset_index(inplace=True)
-    df_total_stats['category'] = df_total_stats.apply(lambda row: row['index'].split('_')[0], axis=1)
-    df_total_stats['age'] = df_total_stats.apply(lambda row: '_'.join(row['index'].split('_')[1:-1]), axis=1)
-    df_total_stats['gender'] = df_total_stats.apply(lambda row: row['index'].split('_')[-1], axis=1)
-    df_total_stats.set_index('index', inplace=True)
-    df_total_stats['value'] = df_total_stats['value'].astype(int)
+    # Cummulative sums for daily stats
+    calculated['calculated_cases_cumsum'] = np.cumsum(raw['cases'])
+    calculated['calculated_deceased_cumsum'] = np.cumsum(raw['deceased'])
+    if last is not None:
+        calculated['calculated_cases_cumsum'] += last['calculated_cases_cumsum']
+        calculated['calculated_deceased_cumsum'] += last['calculated_deceased_cumsum']
+
+    # Daily tests (PCR, rapid, total)
+    if last is None:
+        calculated['calculated_tests_pcr'] = _calculate_daily_tests(raw['total_tests'])
+        calculated['calculated_tests_rapid'] = _calculate_daily_tests(raw['total_rapid_tests'])
+    else:
+        calculated['calculated_tests_pcr'] = _calculate_daily_tests(
+            raw['total_tests'],
+            last_total_tests=last['total_tests'],
+            last_daily_tests=last['calculated_tests_pcr']
+        )
+        calculated['calculated_tests_rapid'] = _calculate_daily_tests(
+            raw['total_rapid_tests'],
+            last_total_tests=last['total_rapid_tests'],
+            last_daily_tests=last['calculated_tests_rapid']
+        )
+    calculated['calculated_tests_total'] = calculated['calculated_tests_pcr'] + calculated['calculated_tests_rapid']
 
-    if save:
-        df_total_stats.to_csv('data/total_stats.csv', index=False)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Daily positivity rate
+        calculated['calculated_positivity'] = raw['cases'] / calculated['calculated_tests_total'] * 100
 
-    return df_total_stats
+        # Fatality rate (data up to current day)
+        calculated['calculated_fatality'] = calculated['calculated_deceased_cumsum'] / calculated['calculated_cases_cumsum'] * 100
 
+    return calculated
 
-# Process three days stats
-def process_three_days_stats(df, save=False):
-    df_three_days_stats = df.copy()
-    
-    if save:
-        df_three_days_stats.to_csv('data/three_days_stats.csv', index=False)
 
-    return df_three_days_stats
+# True if the processed daily stats previous can be updated from the raw daily stats df (same columns and dtypes)
+def _reusable(df, previous):
+    columns = list(df.columns)
+    if list(previous.columns) != columns + DAILY_CALCULATED_COLUMNS:
+        return False
+    return all(previous[column].dtype == df[column].dtype for column in columns)
 
 
-# Process weekly stats
-def process_weekly_stats(df, save=False):
-    df_weekly_stats = df.copy()
+# Process daily stats
+# If previous (the processed daily stats of the last refresh) is given, only
+# the rows from the first new or changed row on are calculated, carrying over
+# the running sums and the last valid test counts from previous. The changed
+# rows are found among the last days only (older revisions change the running
+# totals of the last days too, see revisions). The result is the same as
+# processing the whole history.
+def process_daily_stats(df, previous=None):
+    raw = {column: df[column].to_numpy() for column in df.columns}
+
+    start = 0
+    if previous is not None and _reusable(df, previous):
+        previous = {column: previous[column].to_numpy() for column in previous.columns}
+        start = revisions.first_changed_row(raw, previous, list(raw))
+
+    if start == 0:
+        calculated = _calculate_daily_stats(raw)
+    else:
+        last = {
+            column: previous[column][start - 1]
+            for column in ['total_tests', 'total_rapid_tests'] + DAILY_CALCULATED_COLUMNS
+        }
+        calculated = _calculate_daily_stats({column: values[start:] for column, values in raw.items()}, last=last)
+        calculated = {
+            column: np.concatenate([previous[column][:start], values])
+            for column, values in calculated.items()
+        }
+
+    return pd.DataFrame({**raw, **calculated}, index=df.index)
 
-    if save:
-        df_weekly_stats.to_csv('data/weekly_stats.csv', index=False)
 
-    return df_weekly_stats
+# Process total stats
+def process_total_stats(series):
+    series = series.drop(['id','date','created_at', 'updated_at'])
+
+    # Split index (<category>_<age>_<gender>) into category, age and gender
+    keys = series.index.to_numpy().astype(str)
+    category, _, age_gender = np.char.partition(keys, '_').T
+    age, _, gender = np.char.rpartition(age_gender, '_').T
+
+    # Create total stats dataframe
+    df_total_stats = pd.DataFrame(
+        {
+            'value': series.to_numpy().astype(int),
+            'category': category.astype(object),
+            'age': age.astype(object),
+            'gender': gender.astype(object)
+        },
+        index=pd.Index(series.index, name='index')
+    )
+
+    return df_total_stats
+
+
+# Publish data as the current dataset
+# snapshot: path of the saved snapshot of the data, if it was loaded from one
+def set_data(dfs, version=None, snapshot=None):
+    global published_snapshot
+
+    ds = dataset.publish(
+        daily_stats=dfs['df_daily_stats'],
+        total_stats=dfs['df_total_stats'],
+        version=version
+    )
+    published_snapshot = snapshot
+    return ds
 
 
-def load_new_data(save=False):
+# Get and process new data, then publish it as the current dataset
+# Returns True if the data is up to date (new data was loaded, or the upstream
+# data has not changed). If getting new data fails and data is already loaded,
+# the last good data is kept as is, as well as while the upstream circuit is
+# open (see breaker). If publish_saved is True, the saved snapshot
+# (memory-mapped) is published instead of the processed data.
+def load_new_data(save=False, timeout=None, publish_saved=False):
     print('Getting new data...')
 
-    global df_daily_stats
-    global df_three_days_stats
-    global df_weekly_stats
-    global df_total_stats
+    started = time.monotonic()
 
-    # Get raw data
-    dfs_raw = get_raw_data()
+    # Keep the last good data without requesting the upstream site while its circuit is open
+    if not breaker.allow():
+        print('Upstream circuit open, keeping the last good data.')
+        if dataset.current() is not None:
+            return False
+        return load_saved_data()
 
-    # If getting new raw data failed, read data from saved csv files
+    # Get raw data (only if it changed, when data is already loaded)
+    dfs_raw = get_raw_data(timeout=timeout, conditional=dataset.current() is not None)
     if dfs_raw is None:
-        print('Getting new raw data failed.')
-        dfs = load_data_from_csv()
-        df_daily_stats = dfs['df_daily_stats']
-        df_total_stats = dfs['df_total_stats']
-        df_three_days_stats = dfs['df_three_days_stats']
-        df_weekly_stats = dfs['df_weekly_stats']
+        breaker.record_failure()
     else:
-        # Process data
-        df_daily_stats = process_daily_stats(dfs_raw['df_daily_stats'], save=save)
-        df_total_stats = process_total_stats(dfs_raw['df_total_stats'], save=save)
-        df_three_days_stats = process_three_days_stats(dfs_raw['df_three_days_stats'], save=save)
-        df_weekly_stats = process_weekly_stats(dfs_raw['df_weekly_stats'], save=save)
-
-# Initial call of load_new_data
-load_new_data(save=True)
\ No newline at end of file
+        breaker.record_success()
+
+    if dfs_raw is NOT_MODIFIED:
+        print('Data not modified.')
+        return True
+
+    # If getting new raw data failed, keep the last good data or read data from the saved snapshot
+    if dfs_raw is None:
+        print('Getting new raw data failed.')
+        if dataset.current() is not None:
+            return False
+        return load_saved_data()
+
+    # Process data
+    with metrics.PROCESSING_DURATION.labels('daily_stats').time():
+        previous = dataset.current()
+        df_daily_stats = process_daily_stats(dfs_raw['df_daily_stats'], previous=previous.daily_stats if previous is not None else None)
+    with metrics.PROCESSING_DURATION.labels('total_stats').time():
+        df_total_stats = process_total_stats(dfs_raw['df_total_stats'])
+    dfs = dict(
+        df_daily_stats = df_daily_stats,
+        df_total_stats = df_total_stats
+    )
+
+    if timeout is not None and time.monotonic() - started > timeout:
+        print(f'Getting new data took longer than {timeout}s, keeping the last good data.')
+        if dataset.current() is not None:
+            return False
+
+    # Save the data first, so that the dataset gets the version of the saved snapshot
+    version = None
+    if save:
+        try:
+            with metrics.PROCESSING_DURATION.labels('save').time():
+                version = save_data(dfs)
+        except Exception as err:
+            print(f'Saving data failed: {err}')
+
+    with metrics.PROCESSING_DURATION.labels('publish').time():
+        if not (publish_saved and version is not None and load_saved_data()):
+            set_data(dfs, version=version)
+
+    # Keep every ingested revision of the daily stats
+    if archive.enabled():
+        try:
+            with metrics.PROCESSING_DURATION.labels('archive').time():
+                archive.append(df_daily_stats, published=dataset.current().created)
+        except Exception as err:
+            print(f'Archiving data failed: {err}')
+    fetch_validators.update(dfs_raw['validators'])
+
+    return True
+
+
+# Load the last saved processed data, without getting new data
+# Returns False if there is no saved data
+def load_saved_data():
+    manifest, dfs = load_data_from_snapshot()
+    if dfs is None:
+        return False
+
+    set_data(dfs, version=manifest['version'], snapshot=manifest['path'])
+
+    return True
+
@@ -0,0 +1,92 @@
+import dataclasses
+import hashlib
+import threading
+import time
+import pandas as pd
+import totals
+import aggregates
+import rolling
+
+
+# Windows (days, centered) of the rolling averages calculated when a Dataset is published
+ROLLING_WINDOWS = [(3, False), (7, False)]
+
+
+# Immutable snapshot of the processed data
+# A Dataset is never modified after it is published: new data is published
+# as a new Dataset with a higher version, by replacing the reference to the
+# current one. Readers get the current Dataset once and use it for the whole
+# request, so all frames they see belong to the same version. The frames are
+# shared by all readers and must be treated as read-only (no copies are made).
+@dataclasses.dataclass(frozen=True)
+class Dataset:
+    version: int
+    daily_stats: pd.DataFrame
+    total_stats: pd.DataFrame
+    total_stats_cube: totals.TotalStatsCube
+    aggregates: aggregates.Aggregates
+    # (window, center) -> rolling averages of the daily stats, for ROLLING_WINDOWS
+    rolling_averages: dict
+    # Hash of the data (the same in every process that publishes the same data)
+    fingerprint: str
+    created: float = dataclasses.field(default_factory=time.time)
+
+    # Rolling averages of the daily stats for any window (see rolling.rolling_stats)
+    # Windows other than ROLLING_WINDOWS are calculated on each call.
+    def rolling_stats(self, window, center=False):
+        stats = self.rolling_averages.get((window, center))
+        if stats is None:
+            stats = rolling.rolling_stats(self.daily_stats, window, center=center)
+        return stats
+
+
+_current = None
+_publish_lock = threading.Lock()
+
+
+# Hash of the values of the daily and total stats
+def fingerprint(daily_stats, total_stats):
+    h = hashlib.sha256()
+    for df in (daily_stats, total_stats):
+        h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()[:16]
+
+
+# Get the current Dataset (None if no data has been published yet)
+def current():
+    return _current
+
+
+# Publish new data as the current Dataset
+# The version is the given one (e.g. the version of the saved snapshot), but
+# always higher than the version of the current Dataset.
+def publish(daily_stats, total_stats, version=None):
+    global _current
+
+    # Decode and aggregate the total stats once per dataset version
+    total_stats_cube = totals.from_total_stats(total_stats)
+
+    # Rolling averages, updated from the ones of the current Dataset (only new or changed days are calculated)
+    previous = _current
+    rolling_averages = {
+        (window, center): rolling.rolling_stats(
+            daily_stats, window, center=center,
+            previous=(previous.daily_stats, previous.rolling_averages[(window, center)]) if previous is not None else None
+        )
+        for window, center in ROLLING_WINDOWS
+    }
+
+    with _publish_lock:
+        previous_version = _current.version if _current is not None else 0
+        ds = Dataset(
+            version=max(version or 0, previous_version + 1),
+            daily_stats=daily_stats,
+            total_stats=total_stats,
+            total_stats_cube=total_stats_cube,
+            aggregates=aggregates.compute_aggregates(total_stats_cube),
+            rolling_averages=rolling_averages,
+            fingerprint=fingerprint(daily_stats, total_stats)
+        )
+        _current = ds
+
+    return ds
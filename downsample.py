@@ -0,0 +1,50 @@
+import numpy as np
+
+
+# Largest-Triangle-Three-Buckets downsampling
+# Returns the indices of at most threshold points of y (with x values x,
+# default: evenly spaced) that keep the visual shape of the line. The first
+# and last points are always kept. NaN and infinite values are never
+# preferred over finite values in a bucket.
+def lttb(y, threshold, x=None):
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=float)
+    y = np.where(np.isfinite(y), y, np.nan)
+    x = np.arange(n, dtype=float) if x is None else np.asarray(x, dtype=float)
+
+    # Inner points (all but the first and last) split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    starts = edges[:-1]
+    ends = edges[1:]
+
+    # Average point of each bucket (ignoring NaN), and of the last point as the bucket after the last one
+    valid = ~np.isnan(y[:-1])
+    y_valid = np.where(valid, y[:-1], 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_y = np.add.reduceat(y_valid, starts) / np.add.reduceat(valid.astype(float), starts)
+    avg_x = (x[starts] + x[ends - 1]) / 2
+    avg_x = np.append(avg_x[1:], x[-1]).tolist()
+    avg_y = np.append(avg_y[1:], y[-1]).tolist()
+
+    # Select the point with the largest triangle in each bucket (buckets are
+    # small, so plain Python is faster here than NumPy per bucket)
+    xs = x.tolist()
+    ys = y.tolist()
+    indices = [0]
+    a = 0
+    for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        xa, ya, cx, cy = xs[a], ys[a], avg_x[i], avg_y[i]
+        best = -1.0
+        a = start
+        for j in range(start, end):
+            area = abs((xa - cx) * (ys[j] - ya) - (xa - xs[j]) * (cy - ya))
+            if area > best:
+                best = area
+                a = j
+        indices.append(a)
+    indices.append(n - 1)
+
+    return np.array(indices, dtype=np.int64)
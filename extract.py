@@ -0,0 +1,39 @@
+import re
+
+
+# Stats variables defined in the script of the innews page
+# (the 3-day and weekly averages are calculated from daily_stats, see rolling)
+REQUIRED_STATS = ('daily_stats', 'total_stats')
+OPTIONAL_STATS = ('three_days_stats', 'weekly_stats', 'last_stats')
+
+# Each variable is defined on its own line as `var <name> = <JSON array or object>`
+# (last_stats is commented out on the page, but still matched)
+_stats_pattern = re.compile(
+    rb'var (' + b'|'.join(name.encode() for name in REQUIRED_STATS + OPTIONAL_STATS) + rb') = ([\[{].*[\]}])'
+)
+
+
+# Extract the raw JSON of the stats variables from the page content (bytes)
+# The script that defines daily_stats is located directly in the raw bytes
+# (no DOM is built), and all variables are matched in one pass over it.
+# Returns a dict of stats name -> JSON bytes. Raises ValueError if any of
+# REQUIRED_STATS is missing.
+def extract_stats(content):
+    pos = content.find(b'var daily_stats')
+    if pos < 0:
+        raise ValueError('daily_stats not found in page')
+
+    start = content.rfind(b'<script', 0, pos)
+    end = content.find(b'</script>', pos)
+    if start < 0 or end < 0:
+        raise ValueError('Script with the stats not found in page')
+
+    stats = {}
+    for m in _stats_pattern.finditer(content, start, end):
+        stats.setdefault(m.group(1).decode(), m.group(2))
+
+    missing = [name for name in REQUIRED_STATS if name not in stats]
+    if missing:
+        raise ValueError(f'Stats not found in page: {", ".join(missing)}')
+
+    return stats
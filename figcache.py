@@ -0,0 +1,105 @@
+import concurrent.futures
+import json
+import os
+import dataset
+import figjson
+import graphs
+import lru
+import metrics
+
+
+# Cache of serialized figures (JSON, see figjson), keyed by (dataset version, chart, input)
+# Entries are evicted in least recently used order when the cache holds more
+# than FIGURE_CACHE_BYTES bytes, and a figure is built only once at a time
+# (see lru). All charts and inputs of a dataset version are built in parallel
+# (prewarm) right after it is published, so callbacks only look figures up;
+# readers of a new dataset before prewarm reaches a figure wait for its build.
+
+FIGURE_CACHE_BYTES = int(os.environ.get('FIGURE_CACHE_BYTES', 32 * 1024 * 1024))
+FIGURE_PREWARM_WORKERS = int(os.environ.get('FIGURE_PREWARM_WORKERS', 4))
+
+# Chart name -> (builder, inputs)
+# Charts without inputs are not prewarmed (built on demand).
+CHARTS = {
+    'daily': (
+        lambda input, ds: graphs.daily_line_chart(input, ds=ds),
+        ['Daily', '3-day average', 'Weekly average', 'Running total']
+    ),
+    # Timeline zoomed in on a date range, input: (option, start, end)
+    'daily-window': (
+        lambda input, ds: graphs.daily_line_chart(input[0], ds=ds, window=input[1:]),
+        []
+    ),
+    'age-group': (
+        lambda input, ds: graphs.age_group_bar_chart(ds=ds),
+        [None]
+    ),
+    'gender-pie': (
+        lambda input, ds: graphs.info_by_gender_pie_chart(input, ds=ds),
+        ['cases', 'deceased', 'intubated']
+    ),
+    'sunburst': (
+        lambda input, ds: graphs.info_by_age_group_and_gender_sunburst_chart(input, ds=ds),
+        ['cases', 'deceased', 'intubated']
+    ),
+}
+
+_cache = lru.BoundedLRU(FIGURE_CACHE_BYTES)
+
+stats = dict(
+    prewarms=0
+)
+
+
+# Serialized figure (JSON) of a chart and input for a dataset (default: current dataset)
+def get_figure_json(chart, input=None, ds=None):
+    ds = ds or dataset.current()
+    return _cache.get_or_build((ds.version, chart, input), lambda: _build(chart, input, ds))
+
+
+# Metric label of an input: one of the inputs of the chart, or 'other'
+# (inputs come from the callbacks, so unknown ones must not add time series)
+def _input_label(chart, input):
+    # Zoomed ranges are labelled by option only (not by date range)
+    if chart == 'daily-window':
+        chart, input = 'daily', input[0]
+    return str(input) if input in CHARTS[chart][1] else 'other'
+
+
+def _build(chart, input, ds):
+    builder, _ = CHARTS[chart]
+    labels = (chart, _input_label(chart, input))
+    with metrics.FIGURE_BUILD_DURATION.labels(*labels).time():
+        fig = builder(input, ds)
+    with metrics.FIGURE_SERIALIZE_DURATION.labels(*labels).time():
+        return figjson.to_json(fig)
+
+
+# Figure (dict) of a chart and input for a dataset (default: current dataset)
+def get_figure(chart, input=None, ds=None):
+    return json.loads(get_figure_json(chart, input, ds))
+
+
+# Remove the figures of all other dataset versions
+def discard_other_versions(version):
+    _cache.discard_other_versions(version)
+
+
+# Build and cache all charts and inputs of a dataset (default: current dataset)
+def prewarm(ds=None):
+    ds = ds or dataset.current()
+    discard_other_versions(ds.version)
+
+    keys = [(chart, input) for chart, (_, inputs) in CHARTS.items() for input in inputs]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=FIGURE_PREWARM_WORKERS) as executor:
+        futures = {executor.submit(get_figure_json, chart, input, ds): (chart, input) for chart, input in keys}
+        for future in concurrent.futures.as_completed(futures):
+            if future.exception() is not None:
+                print(f'Building figure {futures[future]} failed: {future.exception()}')
+
+    stats['prewarms'] += 1
+
+
+# Cache statistics
+def cache_stats():
+    return dict(_cache.cache_stats(), **stats)
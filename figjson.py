@@ -0,0 +1,102 @@
+import base64
+import json
+import os
+import numpy as np
+import dash
+
+
+# Serialization of figures to JSON
+# The chart builders pass NumPy arrays to the figures. Numeric and datetime
+# arrays are encoded as plotly.js typed arrays ({'dtype': ..., 'bdata': base64}
+# of the little-endian values, in the smallest dtype that holds them; dates as
+# epoch milliseconds), which are smaller and much faster to encode and decode
+# than lists of numbers. plotly.js decodes typed arrays since version 2.28, so
+# by default (FIGURE_TYPED_ARRAYS=auto) they are used only if Dash serves such
+# a version, otherwise arrays are encoded as plain lists.
+
+# plotly.js typed array integer dtypes, smallest first
+INT_DTYPES = [np.dtype('<i1'), np.dtype('<i2'), np.dtype('<i4')]
+UINT_DTYPES = [np.dtype('<u1'), np.dtype('<u2'), np.dtype('<u4')]
+
+
+# True if the plotly.js served by Dash decodes typed arrays
+# Dash serves the plotly.js bundled with plotly.py if it has _setup_plotlyjs,
+# older versions serve their own (older) plotly.js.
+def plotlyjs_supports_typed_arrays():
+    if not hasattr(dash.Dash, '_setup_plotlyjs'):
+        return False
+    from plotly.offline import get_plotlyjs_version
+    major, minor = get_plotlyjs_version().split('.')[:2]
+    return (int(major), int(minor)) >= (2, 28)
+
+
+def _typed_arrays_setting():
+    setting = os.environ.get('FIGURE_TYPED_ARRAYS', 'auto')
+    if setting == 'auto':
+        return plotlyjs_supports_typed_arrays()
+    return setting not in ('', '0', 'false', 'False')
+
+
+TYPED_ARRAYS = _typed_arrays_setting()
+
+
+# Array as a plotly.js typed array (plain list for arrays of other types)
+def encode_array(values):
+    values = np.asarray(values)
+    kind = values.dtype.kind
+
+    if values.ndim != 1:
+        return plain_array(values)
+    if kind == 'M':
+        values = values.astype('datetime64[ms]').astype(np.int64).astype('<f8')
+    elif kind == 'b':
+        values = values.astype('<u1')
+    elif kind in 'iu':
+        low, high = (values.min(), values.max()) if len(values) else (0, 0)
+        for dtype in (UINT_DTYPES if low >= 0 else INT_DTYPES):
+            if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+                values = values.astype(dtype)
+                break
+        else:
+            values = values.astype('<f8')
+    elif kind == 'f':
+        values = values.astype('<f4' if values.dtype.itemsize <= 4 else '<f8')
+    else:
+        return plain_array(values)
+
+    return {
+        'dtype': values.dtype.str[1:],
+        'bdata': base64.b64encode(np.ascontiguousarray(values).tobytes()).decode('ascii')
+    }
+
+
+# Array as a list (dates as ISO strings, NaN and infinities as null, as JSON has no such numbers)
+def plain_array(values):
+    values = np.asarray(values)
+    if values.dtype.kind == 'M':
+        return np.datetime_as_string(values).tolist()
+    if values.dtype.kind == 'f':
+        return np.where(np.isfinite(values), values, None).tolist()
+    return values.tolist()
+
+
+def _default(obj, typed_arrays):
+    if isinstance(obj, np.ndarray):
+        return encode_array(obj) if typed_arrays else plain_array(obj)
+    if isinstance(obj, np.floating):
+        return obj.item() if np.isfinite(obj) else None
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+# Serialized figure (JSON), with typed arrays if enabled (default: TYPED_ARRAYS)
+# Raises ValueError on a non-finite float that is not in a NumPy array or scalar.
+def to_json(fig, typed_arrays=None):
+    typed_arrays = TYPED_ARRAYS if typed_arrays is None else typed_arrays
+    return json.dumps(
+        fig.to_plotly_json(),
+        default=lambda obj: _default(obj, typed_arrays),
+        separators=(',', ':'),
+        allow_nan=False
+    )
@@ -1,27 +1,74 @@
 import plotly.graph_objects as go
-import plotly.express as px
 from plotly.subplots import make_subplots
 import numpy as np
-import data
+import os
+import dataset
+import downsample
 
 
 template = 'plotly_white'
 # template = 'plotly_dark'
 
+# Maximum number of points per timeline trace (0: no downsampling)
+DAILY_CHART_POINTS = int(os.environ.get('DAILY_CHART_POINTS', 500))
+
+# Visible date range (start, end) of a graph from its relayoutData
+# Returns None if the graph is not zoomed in on a range
+def relayout_window(relayout_data):
+    if not relayout_data:
+        return None
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        start, end = relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    elif 'xaxis.range' in relayout_data:
+        start, end = relayout_data['xaxis.range']
+    else:
+        return None
+    return str(start)[:10], str(end)[:10]
+
+
+# Rows of a timeline frame in a date range (start, end), plus one row on each side
+def _window_rows(df, window):
+    dates = df['date'].to_numpy().astype(str)
+    start = max(np.searchsorted(dates, window[0], side='left') - 1, 0)
+    end = np.searchsorted(dates, window[1], side='right') + 1
+    return df.iloc[start:end]
+
+
+# Rows of a timeline frame kept for all its traces, at most max_points
+# The rows are the union of the LTTB picks of each of the given columns (the
+# traces visible by default, max_points / columns each), so all traces have
+# the same dates and the unified hover label shows the values of one day.
+def _line_indices(df, columns, max_points):
+    if not max_points or len(df) <= max_points:
+        return np.arange(len(df))
+    threshold = max(max_points // len(columns), 3)
+    return np.unique(np.concatenate([downsample.lttb(df[column].to_numpy(), threshold) for column in columns]))
+
+
+# x (dates) and y values of a timeline trace as arrays, at the given rows
+def _line_points(df, column, indices):
+    x = df['date'].to_numpy().astype('datetime64[D]')
+    y = df[column].to_numpy()
+    return x[indices], y[indices]
+
+
 # Functions to create Plotly charts
 
 # Timeline
 # Chart type: line chart (Scatter)
-# Data: df_daily_stats / df_three_days_stats / df_weekly_stats
+# Data: daily_stats / rolling averages of daily_stats (3 and 7 days)
 # Input: Daily / 3-day average / Weekly average / Running total
-def daily_line_chart(input='Daily'):
+# window: date range (start, end) to show, default: all dates
+# Traces have at most max_points points (in the window), at the same dates.
+def daily_line_chart(input='Daily', ds=None, window=None, max_points=DAILY_CHART_POINTS):
+    ds = ds or dataset.current()
     options = {
-        'Daily': data.df_daily_stats,
-        '3-day average': data.df_three_days_stats,
-        'Weekly average': data.df_weekly_stats,
-        'Running total': data.df_daily_stats
+        'Daily': ds.daily_stats,
+        '3-day average': ds.rolling_stats(3),
+        'Weekly average': ds.rolling_stats(7),
+        'Running total': ds.daily_stats
     }
-    df = options[input].copy()
+    df = options[input]
 
     categories = ['cases', 'deceased', 'intubated']
     secondary = ['positivity', 'fatality']
@@ -33,13 +80,20 @@ def daily_line_chart(input='Daily'):
     if input != 'Daily':
         secondary = []
 
+    if window is not None:
+        df = _window_rows(df, window)
+
+    # Points picked from the visible traces only (tests and the secondary traces are legendonly)
+    indices = _line_indices(df, categories, max_points)
+
     fig = make_subplots(specs=[[{'secondary_y': True, 'r': -0.05}]])
 
     for cat in categories:
+        x, y = _line_points(df, cat, indices)
         fig.add_trace(
             go.Scatter(
-                x=df['date'].to_list(),
-                y=df[cat].to_list(),
+                x=x,
+                y=y,
                 mode='lines', # +markers
                 name=cat.capitalize(),
                 legendgroup="group1",
@@ -49,10 +103,11 @@ def daily_line_chart(input='Daily'):
         )
 
     if input == 'Daily':
+        x, y = _line_points(df, 'calculated_tests_total', indices)
         fig.add_trace(
             go.Scatter(
-                x=df['date'].to_list(),
-                y=df['calculated_tests_total'].to_list(),
+                x=x,
+                y=y,
                 mode='lines', # +markers
                 name='Tests',
                 visible='legendonly',
@@ -62,10 +117,11 @@ def daily_line_chart(input='Daily'):
         )
 
     for item in secondary:
+        x, y = _line_points(df, 'calculated_'+item.lower(), indices)
         fig.add_trace(
             go.Scatter(
-                x=df['date'].to_list(),
-                y=df['calculated_'+item.lower()].to_list(),
+                x=x,
+                y=y,
                 mode='lines', # +markers
                 name=item.capitalize() + " (%)",
                 line_dash='dot',
@@ -81,6 +137,8 @@ def daily_line_chart(input='Daily'):
         'yaxis': {'fixedrange': True, 'hoverformat': ','},
         'yaxis2': {'fixedrange': True, 'hoverformat': '.2f', 'showgrid': False,},
         # 'xaxis': {'fixedrange': True},
+        # Keep the zoomed range when the figure is replaced (e.g. with the data of the zoomed range)
+        'xaxis': {'type': 'date', 'uirevision': 'timeline'},
         'hovermode': 'x unified',
         'legend': {'x': 0, 'y': 1, 'groupclick': 'toggleitem', 'orientation': 'h', 'bgcolor': 'rgba(0,0,0,0)'},
         'template': template,
@@ -93,16 +151,16 @@ def daily_line_chart(input='Daily'):
 
 # Info by gender
 # Chart type: Pie chart
-# Data: df_total_stats
+# Data: aggregates (by gender)
 # Input: Cases / Deceased / Intubated
-def info_by_gender_pie_chart(cat):
-    df = data.df_total_stats.copy()
+def info_by_gender_pie_chart(cat, ds=None):
+    agg = (ds or dataset.current()).aggregates
 
     fig = go.Figure(
         data=[
             go.Pie(
-                labels=df['gender'].unique().tolist(),
-                values=df.groupby(['category', 'gender'])[['value']].sum().loc[cat,'value'].to_list(),
+                labels=list(agg.genders),
+                values=agg.by_gender[cat],
                 hole=0.4,
                 textinfo='label+percent',
                 name='',
@@ -117,13 +175,9 @@ def info_by_gender_pie_chart(cat):
         showlegend=False,
     )
 
-    series_deceased_by_gender = df[df['category']=='deceased'].groupby('gender')['value'].sum()
-    series_cases_by_gender = df[df['category']=='cases'].groupby('gender')['value'].sum()
-    series_fatality_by_gender = series_deceased_by_gender / series_cases_by_gender * 100
-
     if cat=='deceased':
         fig.update_traces(
-            hovertext = [f'Fatality: {val:.3f} %' for val in series_fatality_by_gender.to_list()],
+            hovertext = [f'Fatality: {val:.3f} %' for val in agg.fatality_by_gender.tolist()],
             hovertemplate = "%{label}<br>%{value}<br>%{text}<br>"
         )
     
@@ -132,11 +186,9 @@ def info_by_gender_pie_chart(cat):
 
 # Age groups
 # Chart type: Bar chart
-# Data: df_total_stats
-def age_group_bar_chart():
-    df = data.df_total_stats
-    age_labels = np.char.replace( df['age'].unique().astype(np.str_), '_', ' to ')
-    age_labels = np.char.replace( age_labels, 'plus', '+').tolist()
+# Data: aggregates (by age)
+def age_group_bar_chart(ds=None):
+    agg = (ds or dataset.current()).aggregates
 
     categories = ['cases', 'deceased', 'intubated']
 
@@ -144,8 +196,8 @@ def age_group_bar_chart():
 
     for cat in categories:
         fig.add_trace(go.Bar(
-            x=age_labels,
-            y=df.groupby(['category', 'age'])[['value']].sum().loc[cat,'value'].to_list(),
+            x=list(agg.age_labels),
+            y=agg.by_age[cat],
             name=cat.capitalize(),
         ))
 
@@ -158,53 +210,48 @@ def age_group_bar_chart():
         'template': template
     })
 
-    series_deceased_by_age = df[df['category']=='deceased'].groupby('age')['value'].sum()
-    series_cases_by_age = df[df['category']=='cases'].groupby('age')['value'].sum()
-    series_fatality_by_age = series_deceased_by_age / series_cases_by_age * 100
-
     fig.update_traces(
-        hovertext = [f'Fatality: {val:.3f} %' for val in series_fatality_by_age.to_list()],
+        hovertext = [f'Fatality: {val:.3f} %' for val in agg.fatality_by_age.tolist()],
         selector=dict(name="Deceased")
     )
 
     return fig
 
 
+# Sunburst hierarchy (age -> gender) of a category
+# Returns ids, labels, parents, values and fatality of the gender sectors
+# followed by the age sectors
+def sunburst_hierarchy(agg, cat):
+    ages = np.array(agg.age_labels, dtype=object)
+    genders = np.array(agg.genders, dtype=object)
+    leaf_parents = np.repeat(ages, len(genders))
+    leaf_labels = np.tile(genders, len(ages))
+    values = agg.by_age_and_gender[cat]
+
+    return dict(
+        ids=np.concatenate([leaf_parents + '/' + leaf_labels, ages]),
+        labels=np.concatenate([leaf_labels, ages]),
+        parents=np.concatenate([leaf_parents, np.full(len(ages), '', dtype=object)]),
+        values=np.concatenate([values.ravel(), values.sum(axis=1)]),
+        fatality=np.concatenate([agg.fatality_by_age_and_gender.ravel(), agg.fatality_by_age])
+    )
+
+
 # Info by age group and gender
 # Chart type: Sunburst chart
-# Data: df_total_stats
+# Data: aggregates (by age and gender)
 # Input: Cases / Deceased / Intubated
-def info_by_age_group_and_gender_sunburst_chart(cat):
-    df = data.df_total_stats.copy()
-
-    series_deceased_by_age = df[df['category']=='deceased'].groupby('age')['value'].sum()
-    series_cases_by_age = df[df['category']=='cases'].groupby('age')['value'].sum()
-    series_fatality_by_age = series_deceased_by_age / series_cases_by_age * 100
-
-    series_deceased_by_age_and_gender = df[df['category']=='deceased'].groupby(['age', 'gender'])['value'].sum()
-    series_cases_by_age_and_gender = df[df['category']=='cases'].groupby(['age', 'gender'])['value'].sum()
-    series_fatality_by_age_and_gender = series_deceased_by_age_and_gender / series_cases_by_age_and_gender * 100
-
-    df_fatality_by_age_and_gender = series_fatality_by_age_and_gender.reset_index()
-    df_fatality_by_age_and_gender['ids'] = df_fatality_by_age_and_gender['age'] + '/' + df_fatality_by_age_and_gender['gender']
-    df_fatality_by_age_and_gender.set_index('ids', inplace=True)
-
-    df = df[df['category']==cat]
-    df['age'].replace({'0_17': '0 to 17', '18_39': '18 to 39', '40_64': '40 to 64', '65plus': '65+'}, inplace=True)
-
-    fig_tmp = px.sunburst(df, path=['age', 'gender'], values='value')
-    fig_ids = [ item.replace(' to ', '_').replace('+', 'plus') for item in fig_tmp.data[0].ids]
-
-    sunburst_fatality_values = df_fatality_by_age_and_gender.loc[fig_ids[0:-4]]['value'].to_list()
-    sunburst_fatality_values.extend(series_fatality_by_age.loc[fig_ids[-4:]].to_list())
+def info_by_age_group_and_gender_sunburst_chart(cat, ds=None):
+    agg = (ds or dataset.current()).aggregates
+    hierarchy = sunburst_hierarchy(agg, cat)
 
     fig = go.Figure()
 
     fig.add_trace(go.Sunburst(
-        ids=fig_tmp.data[0].ids,
-        labels= fig_tmp.data[0].labels,
-        parents=fig_tmp.data[0].parents,
-        values=fig_tmp.data[0].values,
+        ids=hierarchy['ids'].tolist(),
+        labels=hierarchy['labels'].tolist(),
+        parents=hierarchy['parents'].tolist(),
+        values=hierarchy['values'],
         branchvalues="total",
         name=cat,
     ))
@@ -221,7 +268,7 @@ def info_by_age_group_and_gender_sunburst_chart(cat):
 
     if cat=='deceased':
         fig.update_traces(
-            hovertext = [f'Fatality: {val:.3f} %' for val in sunburst_fatality_values],
+            hovertext = [f'Fatality: {val:.3f} %' for val in hierarchy['fatality'].tolist()],
         )
     
-    return fig
\ No newline at end of file
+    return fig
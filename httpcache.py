@@ -0,0 +1,79 @@
+import glob
+import hashlib
+import os
+import flask
+import dataset
+
+
+# HTTP caching of the layout and callback responses
+#
+# Responses of _dash-layout and _dash-update-component depend only on the
+# data, the request (callback inputs) and the code and settings of the app,
+# so they are tagged with a weak ETag derived from the dataset fingerprint,
+# the request body and a hash of the code and settings. Requests with a
+# matching If-None-Match get a 304 response before the response is built.
+# The layout may be cached by browsers and proxies for HTTP_CACHE_MAX_AGE
+# seconds, then revalidated. Callback responses are answers to POST
+# requests, which browsers and proxies do not cache, so they are marked
+# no-cache and only revalidated by clients that send If-None-Match.
+
+HTTP_CACHE_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', 60))
+
+stats = dict(
+    tagged=0,
+    not_modified=0
+)
+
+
+def _hash(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode())
+        h.update(b'\0')
+    return h.hexdigest()[:32]
+
+
+# Hash of the source code of the app (the .py files next to this module) and of the given settings
+def code_version(*settings):
+    sources = []
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py'))):
+        with open(path, 'rb') as f:
+            sources.append(f.read())
+    return _hash(*sources, *settings)
+
+
+# Enable HTTP caching of the layout and callback responses of a Dash app
+# version: hash of the code and settings that affect the responses (see code_version)
+def init_app(app, version):
+    prefix = app.config.routes_pathname_prefix
+    cache_control = {
+        ('GET', prefix + '_dash-layout'): f'public, max-age={HTTP_CACHE_MAX_AGE}, must-revalidate',
+        ('POST', prefix + '_dash-update-component'): 'no-cache',
+    }
+
+    # ETag of the response to the current request, or None if it is not cached
+    def request_etag():
+        ds = dataset.current()
+        key = (flask.request.method, flask.request.path)
+        if ds is None or key not in cache_control:
+            return None
+        return _hash(version, ds.fingerprint, flask.request.get_data() if key[0] == 'POST' else b'')
+
+    @app.server.before_request
+    def _not_modified():
+        etag = flask.g.etag = request_etag()
+        if etag is not None and flask.request.if_none_match.contains_weak(etag):
+            stats['not_modified'] += 1
+            return flask.Response(status=304)
+        return None
+
+    @app.server.after_request
+    def _cache_headers(response):
+        etag = flask.g.get('etag')
+        if etag is None or response.status_code not in (200, 304):
+            return response
+
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = cache_control[(flask.request.method, flask.request.path)]
+        stats['tagged'] += 1
+        return response
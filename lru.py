@@ -0,0 +1,74 @@
+import collections
+import concurrent.futures
+import threading
+
+
+# Cache of values keyed by tuples whose first item is the dataset version
+# Entries are evicted in least recently used order when the cache holds more
+# than max_bytes bytes (size: function returning the bytes of a value). A
+# value is built only once at a time: concurrent misses of the same key wait
+# for the build in progress (get_or_build).
+class BoundedLRU:
+    def __init__(self, max_bytes, size=len):
+        self.max_bytes = max_bytes
+        self.size = size
+        self.bytes = 0
+        self.stats = dict(hits=0, misses=0, evictions=0)
+        self._entries = collections.OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._entries:
+            _, value = self._entries.popitem(last=False)
+            self.bytes -= self.size(value)
+            self.stats['evictions'] += 1
+
+    def put(self, key, value):
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self.size(self._entries.pop(key))
+            self._entries[key] = value
+            self.bytes += self.size(value)
+            self._evict()
+
+    # Value of a key, built with build() on a miss
+    def get_or_build(self, key, build):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return value
+            self.stats['misses'] += 1
+
+            future = self._building.get(key)
+            building = future is None
+            if building:
+                future = self._building[key] = concurrent.futures.Future()
+
+        if not building:
+            return future.result()
+
+        try:
+            value = build()
+            self.put(key, value)
+            future.set_result(value)
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        finally:
+            with self._lock:
+                del self._building[key]
+        return value
+
+    # Remove the entries of all other dataset versions
+    def discard_other_versions(self, version):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] != version]:
+                self.bytes -= self.size(self._entries.pop(key))
+
+    # Cache statistics
+    def cache_stats(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self.bytes, max_bytes=self.max_bytes)
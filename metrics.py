@@ -0,0 +1,121 @@
+import os
+import time
+import flask
+import prometheus_client
+from prometheus_client import Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+
+# Prometheus metrics
+#
+# Timings of the data refresh (fetch, parse, processing steps), of building
+# and serializing figures and of the layout and callback responses are
+# recorded in histograms. Counters of the caches, the fetches and the refreshes
+# are kept in the stats dicts of their modules and read only when the metrics
+# are scraped (see register_stats), so they cost nothing on the request path.
+#
+# With several worker processes, set PROMETHEUS_MULTIPROC_DIR to an empty
+# directory to aggregate the histograms of all workers (see the
+# prometheus_client documentation). The stats are those of the worker that
+# answers the scrape, labelled with its pid.
+
+MULTIPROCESS = 'PROMETHEUS_MULTIPROC_DIR' in os.environ or 'prometheus_multiproc_dir' in os.environ
+
+FETCH_DURATION = Histogram(
+    'covid_fetch_duration_seconds', 'Duration of the upstream page requests',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+FETCH_BYTES = Histogram(
+    'covid_fetch_bytes', 'Size of the upstream page responses',
+    buckets=(2 ** 14, 2 ** 16, 2 ** 18, 2 ** 19, 2 ** 20, 2 ** 21, 2 ** 22, 2 ** 23)
+)
+PARSE_DURATION = Histogram(
+    'covid_parse_duration_seconds', 'Duration of extracting and parsing the stats of the upstream page',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+PROCESSING_DURATION = Histogram(
+    'covid_processing_duration_seconds', 'Duration of each data processing step', ['step'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+)
+FIGURE_BUILD_DURATION = Histogram(
+    'covid_figure_build_duration_seconds', 'Duration of building a figure', ['chart', 'input'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+FIGURE_SERIALIZE_DURATION = Histogram(
+    'covid_figure_serialize_duration_seconds', 'Duration of serializing a figure', ['chart', 'input'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+REQUEST_DURATION = Histogram(
+    'covid_request_duration_seconds', 'Duration of the layout, callback and API responses', ['endpoint'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+
+# Counters and gauges read from stats dicts when the metrics are scraped
+class StatsCollector:
+    def __init__(self):
+        self.stats = []
+        self.gauges = []
+
+    def collect(self):
+        labels = ['pid'] if MULTIPROCESS else []
+        values = [str(os.getpid())] if MULTIPROCESS else []
+
+        for name, description, get_stats, keys in self.stats:
+            stats = get_stats()
+            for key in keys:
+                metric = CounterMetricFamily(f'covid_{name}_{key}', f'{description}: {key}', labels=labels)
+                metric.add_metric(values, stats[key] or 0)
+                yield metric
+
+        for name, description, get_value in self.gauges:
+            value = get_value()
+            if value is not None:
+                metric = GaugeMetricFamily(f'covid_{name}', description, labels=labels)
+                metric.add_metric(values, value)
+                yield metric
+
+
+_stats_collector = StatsCollector()
+if not MULTIPROCESS:
+    prometheus_client.REGISTRY.register(_stats_collector)
+
+
+# Export counters of a stats dict (returned by get_stats) as covid_<name>_<key>_total
+def register_stats(name, description, get_stats, keys):
+    _stats_collector.stats.append((name, description, get_stats, keys))
+
+
+# Export a value (returned by get_value, None: no value) as the gauge covid_<name>
+def register_gauge(name, description, get_value):
+    _stats_collector.gauges.append((name, description, get_value))
+
+
+def _registry():
+    if not MULTIPROCESS:
+        return prometheus_client.REGISTRY
+
+    from prometheus_client import multiprocess
+    registry = prometheus_client.CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(_stats_collector)
+    return registry
+
+
+# Add the /metrics endpoint and the request duration histogram for the given paths (path -> endpoint label)
+def init_app(server, paths):
+    @server.route('/metrics')
+    def serve_metrics():
+        return flask.Response(prometheus_client.generate_latest(_registry()), mimetype=prometheus_client.CONTENT_TYPE_LATEST)
+
+    @server.before_request
+    def _start_timer():
+        flask.g.metrics_started = time.perf_counter()
+
+    @server.after_request
+    def _observe_duration(response):
+        endpoint = paths.get(flask.request.path)
+        started = flask.g.get('metrics_started')
+        if endpoint is not None and started is not None:
+            REQUEST_DURATION.labels(endpoint).observe(time.perf_counter() - started)
+        return response
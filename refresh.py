@@ -0,0 +1,198 @@
+import threading
+import random
+import time
+import os
+import data
+import dataset
+import figcache
+import api
+import shared
+
+
+# Refresh settings (in seconds)
+REFRESH_INTERVAL = float(os.environ.get('REFRESH_INTERVAL', 300))
+REFRESH_JITTER = float(os.environ.get('REFRESH_JITTER', 30))
+REFRESH_TIMEOUT = float(os.environ.get('REFRESH_TIMEOUT', 60))
+
+# Startup mode
+# warm: start from the last saved data and get new data in the background
+#       (falls back to blocking if there is no saved data)
+# blocking: get new data before serving
+STARTUP_MODE = os.environ.get('STARTUP_MODE', 'warm')
+
+# Share the dataset between the worker processes (see shared): only the
+# leader process gets new data, the other processes attach its snapshots
+SHARED_DATASET = os.environ.get('SHARED_DATASET', '') not in ('', '0', 'false', 'False')
+
+_refresh_lock = threading.Lock()
+_stop_event = threading.Event()
+_thread = None
+
+# Status of startup and of the last refresh
+status = dict(
+    last_started=None,
+    last_finished=None,
+    last_duration=None,
+    last_success=None,
+    refreshes=0,
+    skipped=0,
+    import_duration=None,
+    startup_mode=None,
+    startup_duration=None,
+    ready_duration=None,
+    role=None,
+    attaches=0,
+)
+
+
+# Refresh data once
+# Single-flight: if a refresh is already running, return None without waiting for it.
+# Readers keep getting the last good data while the refresh runs.
+def refresh_now(save=True):
+    if not _refresh_lock.acquire(blocking=False):
+        status['skipped'] += 1
+        return None
+
+    try:
+        status['last_started'] = time.time()
+        previous = dataset.current()
+        try:
+            success = data.load_new_data(
+                save=save or SHARED_DATASET,
+                timeout=REFRESH_TIMEOUT,
+                publish_saved=SHARED_DATASET
+            )
+        except Exception as err:
+            print(f'Refreshing data failed: {err}')
+            success = False
+
+        # Build the figures of a new dataset before readers ask for them
+        if dataset.current() is not previous:
+            prewarm()
+
+        status['last_finished'] = time.time()
+        status['last_duration'] = status['last_finished'] - status['last_started']
+        status['last_success'] = success
+        status['refreshes'] += 1
+        return success
+    finally:
+        _refresh_lock.release()
+
+
+# Publish the current snapshot of the leader process, if it is not the one of the current dataset (shared dataset)
+def follow_now():
+    previous = dataset.current()
+    try:
+        if shared.attach():
+            status['attaches'] += 1
+    except Exception as err:
+        print(f'Attaching shared data failed: {err}')
+
+    if dataset.current() is not previous:
+        prewarm()
+
+
+# Refresh data once, or follow the leader process (shared dataset)
+# Returns the time to wait until the next run
+def _run_once():
+    if SHARED_DATASET and not shared.try_become_leader():
+        status['role'] = 'follower'
+        follow_now()
+        return shared.SHARED_POLL_INTERVAL
+
+    if SHARED_DATASET:
+        status['role'] = 'leader'
+    refresh_now()
+    return next_delay()
+
+
+# Time to wait until the next refresh
+def next_delay():
+    return max(0.0, REFRESH_INTERVAL + random.uniform(-REFRESH_JITTER, REFRESH_JITTER))
+
+
+# Build and cache the figures and the first API pages of the current dataset
+def prewarm():
+    try:
+        figcache.prewarm()
+    except Exception as err:
+        print(f'Building figures failed: {err}')
+    try:
+        api.prewarm()
+    except Exception as err:
+        print(f'Encoding API responses failed: {err}')
+
+
+def _run(initial_delay):
+    # Figures of the data loaded at startup
+    if dataset.current() is not None and not figcache.cache_stats()['prewarms']:
+        prewarm()
+
+    delay = initial_delay
+    while not _stop_event.wait(delay):
+        delay = _run_once()
+
+
+# Start the background refresh thread (once per process)
+# The first refresh runs after initial_delay seconds (default: a full interval)
+def start(initial_delay=None):
+    global _thread
+
+    if _thread is not None and _thread.is_alive():
+        return _thread
+
+    if initial_delay is None:
+        initial_delay = next_delay()
+
+    _stop_event.clear()
+    _thread = threading.Thread(target=_run, args=(initial_delay,), name='data-refresh', daemon=True)
+    _thread.start()
+    return _thread
+
+
+# Load the initial data of a follower process (shared dataset) and start following the leader
+# Without saved data, waits up to REFRESH_TIMEOUT seconds for the leader to
+# save its first snapshot before getting new data on its own (not saved).
+def _startup_follower():
+    status['role'] = 'follower'
+    if not data.load_saved_data():
+        print('No saved data found, waiting for the leader process.')
+        if not shared.wait_and_attach(REFRESH_TIMEOUT) and not data.load_new_data(timeout=REFRESH_TIMEOUT):
+            print('Getting new data at startup failed.')
+    start(initial_delay=shared.SHARED_POLL_INTERVAL)
+
+
+# Load the initial data and start the background refresh thread
+# In warm mode only the last saved data is read at startup, and the first
+# refresh runs in the background within REFRESH_JITTER seconds, so that
+# workers starting together do not all hit the upstream site at once.
+# With a shared dataset, only the leader process gets new data.
+def startup(mode=None):
+    mode = mode or STARTUP_MODE
+    started = time.perf_counter()
+
+    if SHARED_DATASET and not shared.try_become_leader():
+        _startup_follower()
+        mode = 'follower'
+    elif mode == 'warm' and data.load_saved_data():
+        start(initial_delay=random.uniform(0, REFRESH_JITTER))
+    else:
+        if mode == 'warm':
+            print('No saved data found, getting new data before serving.')
+            mode = 'blocking'
+        if not refresh_now():
+            print('Getting new data at startup failed.')
+        start()
+
+    if SHARED_DATASET and shared.is_leader():
+        status['role'] = 'leader'
+    status['startup_mode'] = mode
+    status['startup_duration'] = time.perf_counter() - started
+    print(f'Data loaded at startup in {status["startup_duration"] * 1000:.1f} ms ({mode})')
+
+
+# Stop the background refresh thread
+def stop(timeout=None):
+    _stop_event.set()
+    if _thread is not None:
+        _thread.join(timeout)
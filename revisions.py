@@ -0,0 +1,46 @@
+import os
+import numpy as np
+
+
+# Detection of the rows that changed between two versions of a daily frame
+#
+# The upstream data adds days at the end and revises only the last few days.
+# A revision of an older day also changes the running totals (total_cases,
+# total_deceased, total_tests, ...) of every later day, so comparing only the
+# last REVISED_DAYS rows of the frames (including the running totals) finds
+# the first changed row without scanning the whole history. If the first
+# compared row differs, the change may start before it, and the whole frame
+# is treated as changed.
+
+# Days at the end of the data that are compared with the previous version
+REVISED_DAYS = int(os.environ.get('REVISED_DAYS', 28))
+
+
+def _differs(a, b):
+    if a.dtype.kind == 'f' and b.dtype.kind == 'f':
+        return (a != b) & ~(np.isnan(a) & np.isnan(b))
+    return a != b
+
+
+# First row of new that is new or differs from previous in the given columns
+# new and previous are frames or dicts of column arrays. Compares only the
+# last REVISED_DAYS rows present in both. Returns 0 if the change may start
+# before them (recalculate everything), otherwise the number of rows of
+# previous that are unchanged.
+def first_changed_row(new, previous, columns, tail=None):
+    tail = REVISED_DAYS if tail is None else tail
+    new = {column: np.asarray(new[column]) for column in columns}
+    previous = {column: np.asarray(previous[column]) for column in columns}
+    rows = min(len(new[columns[0]]), len(previous[columns[0]]))
+    first = max(rows - tail, 0)
+
+    changed = np.zeros(rows - first, dtype=bool)
+    for column in columns:
+        changed |= _differs(new[column][first:rows], previous[column][first:rows])
+
+    if not changed.any():
+        return rows
+    row = int(changed.argmax())
+    if row == 0 and first > 0:
+        return 0
+    return first + row
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+import revisions
+
+
+# Rolling averages of the daily stats
+# Any window length is computed from the processed daily stats, trailing
+# (labelled with the last day of the window) or centered (labelled like
+# pandas' rolling(center=True)). Only days with a complete window are
+# included. The trailing windows are assumed to be the convention of the
+# 3-day and weekly averages of the innews page; this is not verified against
+# recorded upstream data (the page fixture is synthetic).
+
+# Daily stats columns that are averaged
+AVERAGE_COLUMNS = ['cases', 'deceased', 'intubated']
+
+
+# Number of days of a window before and after the day it is labelled with
+def window_offsets(window, center=False):
+    if center:
+        return window // 2, (window - 1) // 2
+    return window - 1, 0
+
+
+# Means of all complete windows of window consecutive values
+# (len(values) - window + 1 means, NaN only for windows that contain NaN).
+# Each window is summed on its own, so the mean of a window does not depend
+# on the values outside of it.
+def window_means(values, window):
+    values = np.asarray(values, dtype=float)
+    if len(values) < window:
+        return np.empty(0)
+    return sliding_window_view(values, window).sum(axis=1) / window
+
+
+# Rolling averages of the daily stats (date and AVERAGE_COLUMNS)
+# If previous (daily_stats, rolling_stats) of the last version are given,
+# only the days whose window contains a new or changed day are calculated.
+# The result is the same as calculating all days.
+def rolling_stats(daily_stats, window, center=False, previous=None):
+    if window < 1:
+        raise ValueError(f'Invalid window: {window}')
+
+    before, after = window_offsets(window, center)
+    start = 0
+    if previous is not None:
+        previous_daily_stats, previous_rolling_stats = previous
+        # Row i of the rolling stats is the window that starts on day i
+        start = min(_first_changed_day(daily_stats, previous_daily_stats) - window + 1, len(previous_rolling_stats))
+        start = max(start, 0)
+
+    columns = {
+        'date': daily_stats['date'].to_numpy()[start + before:len(daily_stats) - after]
+    }
+    for column in AVERAGE_COLUMNS:
+        columns[column] = window_means(daily_stats[column].to_numpy()[start:], window)
+
+    if start > 0:
+        columns = {
+            column: np.concatenate([previous_rolling_stats[column].to_numpy()[:start], values])
+            for column, values in columns.items()
+        }
+
+    return pd.DataFrame(columns)
+
+
+# Running sums of the averaged columns (a revision of an older day changes them on the last days)
+RUNNING_SUM_COLUMNS = ['calculated_cases_cumsum', 'calculated_deceased_cumsum']
+
+
+# First day of daily_stats that is new or differs from previous (in date, AVERAGE_COLUMNS or
+# their running sums), among the last days only (see revisions)
+def _first_changed_day(daily_stats, previous):
+    columns = ['date'] + AVERAGE_COLUMNS + [column for column in RUNNING_SUM_COLUMNS if column in daily_stats and column in previous]
+    return revisions.first_changed_row(daily_stats, previous, columns)
@@ -0,0 +1,87 @@
+import os
+import time
+import data
+import dataset
+import store
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+# Dataset shared by the worker processes of a server (e.g. gunicorn workers)
+#
+# One process, the leader, holds an exclusive lock on LOCK_FILE in the
+# snapshot directory. Only the leader gets new data, saves it as a snapshot
+# and publishes the snapshot as its dataset. The other processes (followers)
+# check the snapshot manifest every SHARED_POLL_INTERVAL seconds and publish
+# new snapshots as their dataset. The numeric columns of snapshots are
+# memory-mapped, so their pages are shared by all processes instead of being
+# copied into each one, and all processes serve the same dataset version. The
+# lock is released when the leader exits, and the next follower that tries
+# to take it becomes the leader.
+#
+# The lock must be taken in the worker processes, not before they are forked
+# (i.e. not with gunicorn --preload). Without fcntl (Windows) every process
+# is its own leader.
+
+LOCK_FILE = 'leader.lock'
+SHARED_POLL_INTERVAL = float(os.environ.get('SHARED_POLL_INTERVAL', 5))
+
+_lock_file = None
+
+
+# Take the leader lock if no other process holds it
+# Returns True if this process is the leader.
+def try_become_leader():
+    global _lock_file
+
+    if _lock_file is not None or fcntl is None:
+        return True
+
+    os.makedirs(store.SNAPSHOT_DIR, exist_ok=True)
+    lock_file = open(os.path.join(store.SNAPSHOT_DIR, LOCK_FILE), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+
+    lock_file.truncate(0)
+    lock_file.write(f'{os.getpid()}\n')
+    lock_file.flush()
+    _lock_file = lock_file
+    print(f'Process {os.getpid()} is the data leader.')
+    return True
+
+
+def is_leader():
+    return _lock_file is not None or fcntl is None
+
+
+# Publish the current snapshot, if it is not the one of the current dataset
+# Snapshots are compared by path, not by version: a follower that got data
+# on its own (no snapshot yet) has a version of its own.
+# Returns True if a new dataset was published.
+def attach():
+    manifest = store.read_manifest()
+    if manifest is None:
+        return False
+
+    if dataset.current() is not None and manifest['path'] == data.published_snapshot:
+        return False
+
+    return data.load_saved_data()
+
+
+# Wait until there is a snapshot (saved by the leader) and publish it
+# Returns False if there is none after timeout seconds.
+def wait_and_attach(timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        if attach():
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(min(SHARED_POLL_INTERVAL, 1.0))
@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+import json
+import os
+import shutil
+import time
+import uuid
+
+
+# Snapshot store for processed data
+#
+# A snapshot is a directory with one .npy file per column (and per index, if
+# the index is not a RangeIndex) of each frame. manifest.json points to the
+# current snapshot directory and holds the version and the exact schema
+# (column order, dtypes, index) of every frame. Snapshots are written to a
+# temporary directory, renamed into place and published by atomically
+# replacing the manifest, so readers never see a partially written snapshot.
+# Columns are loaded as memory-mapped arrays.
+
+FORMAT_VERSION = 1
+
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', 'data/snapshot')
+MANIFEST_FILE = 'manifest.json'
+
+# Number of previous snapshot directories kept besides the current one
+KEEP_SNAPSHOTS = 2
+
+
+def _manifest_path(directory):
+    return os.path.join(directory, MANIFEST_FILE)
+
+
+# Read the manifest of the current snapshot, or None if there is no snapshot
+def read_manifest(directory=SNAPSHOT_DIR):
+    try:
+        with open(_manifest_path(directory)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    if manifest.get('format') != FORMAT_VERSION:
+        print(f'Unsupported snapshot format: {manifest.get("format")}')
+        return None
+
+    return manifest
+
+
+def _save_array(path, values):
+    values = np.asarray(values)
+    # Strings (and other objects) are stored as fixed width unicode
+    if values.dtype == object:
+        values = values.astype(str)
+    np.save(path, values, allow_pickle=False)
+
+
+def _save_frame(path, df):
+    os.makedirs(path)
+
+    columns = []
+    for i, (name, series) in enumerate(df.items()):
+        file = f'c{i}.npy'
+        _save_array(os.path.join(path, file), series.to_numpy())
+        columns.append(dict(name=name, dtype=str(series.dtype), file=file))
+
+    if isinstance(df.index, pd.RangeIndex):
+        index = dict(
+            type='range',
+            name=df.index.name,
+            start=int(df.index.start),
+            stop=int(df.index.stop),
+            step=int(df.index.step)
+        )
+    else:
+        _save_array(os.path.join(path, 'index.npy'), df.index.to_numpy())
+        index = dict(type='array', name=df.index.name, dtype=str(df.index.dtype), file='index.npy')
+
+    return dict(rows=len(df), columns=columns, index=index)
+
+
+# Save frames (dict of name -> DataFrame) as a new snapshot
+# Returns the manifest of the new snapshot
+def save_snapshot(frames, directory=SNAPSHOT_DIR):
+    os.makedirs(directory, exist_ok=True)
+
+    previous = read_manifest(directory)
+    version = previous['version'] + 1 if previous else 1
+
+    name = f'v{version:08d}-{uuid.uuid4().hex[:8]}'
+    tmp_path = os.path.join(directory, name + '.tmp')
+
+    try:
+        schema = {
+            frame_name: _save_frame(os.path.join(tmp_path, frame_name), df)
+            for frame_name, df in frames.items()
+        }
+        os.rename(tmp_path, os.path.join(directory, name))
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    manifest = dict(
+        format=FORMAT_VERSION,
+        version=version,
+        path=name,
+        created=time.time(),
+        frames=schema
+    )
+
+    tmp_manifest = _manifest_path(directory) + f'.{uuid.uuid4().hex[:8]}.tmp'
+    with open(tmp_manifest, 'w') as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_manifest, _manifest_path(directory))
+
+    _remove_old_snapshots(directory, name)
+
+    return manifest
+
+
+def _remove_old_snapshots(directory, current):
+    snapshots = sorted(
+        (entry for entry in os.scandir(directory) if entry.is_dir() and not entry.name.endswith('.tmp')),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True
+    )
+    old = [entry for entry in snapshots if entry.name != current][KEEP_SNAPSHOTS:]
+    for entry in old:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _load_array(path, dtype):
+    # Plain ndarray view of the memory map (no copy)
+    values = np.asarray(np.load(path, mmap_mode='r', allow_pickle=False))
+    if dtype == 'object':
+        values = values.astype(object)
+    return values
+
+
+def _load_frame(path, schema):
+    df = pd.DataFrame(
+        {
+            column['name']: _load_array(os.path.join(path, column['file']), column['dtype'])
+            for column in schema['columns']
+        },
+        columns=[column['name'] for column in schema['columns']],
+        copy=False
+    )
+
+    index = schema['index']
+    if index['type'] == 'range':
+        df.index = pd.RangeIndex(index['start'], index['stop'], index['step'], name=index['name'])
+    else:
+        df.index = pd.Index(_load_array(os.path.join(path, index['file']), index['dtype']), name=index['name'])
+
+    return df
+
+
+# Load the current snapshot
+# Returns (manifest, dict of name -> DataFrame), or (None, None) if there is no snapshot
+def load_snapshot(directory=SNAPSHOT_DIR):
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None, None
+
+    path = os.path.join(directory, manifest['path'])
+    frames = {
+        frame_name: _load_frame(os.path.join(path, frame_name), schema)
+        for frame_name, schema in manifest['frames'].items()
+    }
+
+    return manifest, frames
+
+
+# Export frames (dict of name -> DataFrame) as csv files (<name>.csv)
+def export_csv(frames, directory='data'):
+    os.makedirs(directory, exist_ok=True)
+    for name, df in frames.items():
+        df.to_csv(os.path.join(directory, f'{name}.csv'), index=not isinstance(df.index, pd.RangeIndex))
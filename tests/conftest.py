@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The app modules and the synthetic data of the benchmarks
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
@@ -0,0 +1,46 @@
+# Data API requests (api.get_response)
+import json
+import pytest
+import api
+import data
+import synthetic
+
+
+@pytest.fixture(scope='module')
+def ds():
+    raw = synthetic.raw_data(1)
+    return data.set_data(dict(
+        df_daily_stats=data.process_daily_stats(raw['df_daily_stats']),
+        df_total_stats=data.process_total_stats(raw['df_total_stats'])
+    ))
+
+
+@pytest.mark.parametrize('args', [
+    dict(limit='0'), dict(limit='-1'), dict(limit='²'), dict(limit='1.5'), dict(limit=str(api.API_PAGE_SIZE + 1)),
+    dict(window='²'), dict(format='xml'), dict(cursor='!'), dict(fields='unknown'), dict(to='2020-13-01'),
+])
+def test_invalid_parameters(ds, args):
+    with pytest.raises(api.BadRequest):
+        api.get_response('rolling', args, ds)
+
+
+def test_pages(ds):
+    rows = []
+    args = dict(limit='100', fields='date,cases')
+    while True:
+        page = json.loads(api.get_response('daily', args, ds).bodies[None])
+        rows += page['data']
+        if page['next_cursor'] is None:
+            break
+        args['cursor'] = page['next_cursor']
+    assert rows == ds.daily_stats[['date', 'cases']].to_dict(orient='records')
+
+
+def test_non_ascii_and_non_finite_cells():
+    import pandas as pd
+    df = pd.DataFrame(dict(name=['Αθήνα', 'a,"b"', ''], value=[1.5, float('inf'), float('nan')]))
+    table = api.Table(df, False)
+    body = api.encode(table, 'json', table.fields, 0, 3, None, 1)
+    assert json.loads(body)['data'] == [dict(name='Αθήνα', value=1.5), dict(name='a,"b"', value=None), dict(name='', value=None)]
+    csv = api.encode(table, 'csv', table.fields, 0, 3, None, 1)
+    assert csv.decode() == 'name,value\nΑθήνα,1.5\n"a,""b""",\n,\n'
@@ -0,0 +1,86 @@
+# Append-only archive of the daily stats
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import archive
+
+
+@pytest.fixture(autouse=True)
+def reset_archive():
+    archive._archive, archive._partitions_dir, archive._partitions = None, None, {}
+    yield
+    archive._archive, archive._partitions_dir, archive._partitions = None, None, {}
+
+
+def daily_stats(days=40, **columns):
+    df = pd.DataFrame(dict(
+        date=pd.date_range('2020-03-01', periods=days),
+        new_cases=np.arange(days, dtype='i8'),
+    ))
+    return df.assign(**columns)
+
+
+def test_appends_only_changed_rows(tmp_path):
+    directory = str(tmp_path)
+    assert archive.append(daily_stats(), published=1.6e9, directory=directory) == 40
+    assert archive.append(daily_stats(), published=1.6e9 + 1, directory=directory) == 0
+
+    df = daily_stats(41)
+    df.loc[39, 'new_cases'] = 100
+    assert archive.append(df, published=1.6e9 + 2, directory=directory) == 2
+    assert len(archive.revisions(directory=directory)) == 42
+
+
+def test_rereads_only_changed_partitions(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    archive.append(daily_stats(), published=1.6e9, directory=directory)
+
+    reads = []
+    read_partition = archive._read_partition
+    monkeypatch.setattr(archive, '_read_partition', lambda path, dtype: reads.append(os.path.basename(path)) or read_partition(path, dtype))
+
+    loaded = archive._archive
+    assert archive.load(directory) == 40
+    assert archive._archive is loaded
+    assert reads == []
+
+    # Appending to another process's archive: April changed, March did not
+    with open(os.path.join(directory, archive.PARTITIONS_DIR, '2020-04.bin'), 'ab') as f:
+        f.write(archive._archive[0][-1:].tobytes())
+    assert archive.load(directory) == 41
+    assert reads == ['2020-04.bin']
+
+
+def test_casts_to_archived_dtypes(tmp_path):
+    directory = str(tmp_path)
+    archive.append(daily_stats(), published=1.6e9, directory=directory)
+
+    df = daily_stats(41)
+    df['new_cases'] = df['new_cases'].astype('f8')
+    assert archive.append(df, published=1.6e9 + 1, directory=directory) == 1
+    assert archive._archive[0].dtype['new_cases'] == np.dtype('i8')
+
+
+def test_widens_schema(tmp_path):
+    directory = str(tmp_path)
+    archive.append(daily_stats(), published=1.6e9, directory=directory)
+
+    # An integer column with a missing value and a new column
+    df = daily_stats(41, new_tests=np.arange(41) * 2.0)
+    df['new_cases'] = df['new_cases'].astype('f8')
+    df.loc[40, 'new_cases'] = np.nan
+    assert archive.append(df, published=1.6e9 + 1, directory=directory) == 41
+
+    dtype = archive._archive[0].dtype
+    assert dtype['new_cases'] == dtype['new_tests'] == np.dtype('f8')
+    assert not os.path.exists(os.path.join(directory, archive.PARTITIONS_DIR))
+
+    # Later refreshes append to the widened archive, also after a reload
+    assert archive.append(daily_stats(42, new_tests=np.arange(42) * 2.0), published=1.6e9 + 2, directory=directory) == 2
+    archive._archive, archive._partitions_dir, archive._partitions = None, None, {}
+    rows = archive.revisions(directory=directory)
+    assert len(rows) == 83
+    first = archive.to_frame(rows[rows['published'] == rows['published'].min()])
+    assert first['new_cases'].tolist() == list(range(40))
+    assert first['new_tests'].isna().all()
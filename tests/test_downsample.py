@@ -0,0 +1,34 @@
+# LTTB downsampling of the timeline traces
+import numpy as np
+import pandas as pd
+import downsample
+import graphs
+
+
+def test_keeps_peaks():
+    y = np.zeros(1000)
+    y[[100, 500, 900]] = [5, -7, 3]
+    indices = downsample.lttb(y, 50)
+    assert len(indices) == 50
+    assert {0, 100, 500, 900, 999} <= set(indices.tolist())
+
+
+def test_ignores_non_finite_values():
+    y = np.sin(np.arange(1000) / 20)
+    y[::7] = np.inf
+    y[3::7] = np.nan
+    indices = downsample.lttb(y, 100)
+    assert np.isfinite(y[indices[1:-1]]).all()
+    assert np.array_equal(indices, downsample.lttb(np.where(np.isfinite(y), y, np.nan), 100))
+
+
+def test_line_indices_of_visible_traces_only():
+    days = 2000
+    df = pd.DataFrame(dict(
+        date=pd.date_range('2020-01-01', periods=days),
+        cases=np.sin(np.arange(days) / 30) * 100 + 100,
+        calculated_positivity=np.where(np.arange(days) % 5, np.inf, 1.0),
+    ))
+    indices = graphs._line_indices(df, ['cases'], 200)
+    assert len(indices) == 200
+    assert np.array_equal(indices, downsample.lttb(df['cases'].to_numpy(), 200))
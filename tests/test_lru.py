@@ -0,0 +1,47 @@
+# Bounded LRU cache shared by the figure and API response caches
+import threading
+import lru
+
+
+def test_evicts_least_recently_used():
+    cache = lru.BoundedLRU(10)
+    cache.get_or_build((1, 'a'), lambda: 'aaaa')
+    cache.get_or_build((1, 'b'), lambda: 'bbbb')
+    cache.get_or_build((1, 'a'), lambda: 'unused')
+    cache.get_or_build((1, 'c'), lambda: 'cccc')
+    assert cache.cache_stats() == dict(hits=1, misses=3, evictions=1, entries=2, bytes=8, max_bytes=10)
+    assert cache.get_or_build((1, 'a'), lambda: 'rebuilt') == 'aaaa'
+
+
+def test_discards_other_versions():
+    cache = lru.BoundedLRU(100)
+    cache.get_or_build((1, 'a'), lambda: 'a')
+    cache.get_or_build((2, 'a'), lambda: 'b')
+    cache.discard_other_versions(2)
+    assert cache.cache_stats()['entries'] == 1
+    assert cache.bytes == 1
+
+
+def test_concurrent_misses_build_once():
+    cache = lru.BoundedLRU(100)
+    builds = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def build():
+        builds.append(1)
+        started.set()
+        release.wait()
+        return 'value'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_build((1, 'a'), build))) for _ in range(8)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert builds == [1]
+    assert results == ['value'] * 8
@@ -0,0 +1,59 @@
+# Incremental processing of the daily stats gives the same result as a full recompute
+import pandas as pd
+import pytest
+import data
+import revisions
+import synthetic
+
+DAYS = 1000
+
+
+# Raw daily stats with the cases of a day revised (and the running totals of the later days)
+def revised(df, day, delta=10):
+    df = df.copy()
+    df.loc[day, 'cases'] += delta
+    df.loc[day:, 'total_cases'] += delta
+    return df
+
+
+def _cases():
+    df_raw = synthetic.daily_stats(DAYS, seed=1)
+
+    # Negative test differences in the new days (forward filled from the previous days)
+    df_negative = df_raw.copy()
+    df_negative.loc[DAYS - 2:, 'total_tests'] -= 10 ** 6
+    df_negative.loc[DAYS - 1, 'total_rapid_tests'] -= 10 ** 7
+
+    return dict(
+        new_day=(df_raw.iloc[:-1], df_raw),
+        new_days=(df_raw.iloc[:-7], df_raw),
+        unchanged=(df_raw, df_raw),
+        fewer_days=(df_raw, df_raw.iloc[:-3]),
+        short_history=(df_raw.iloc[:2], df_raw.iloc[:20]),
+        revised_recent_day=(df_raw.iloc[:-1], revised(df_raw, DAYS - 5)),
+        revised_old_day=(df_raw.iloc[:-1], revised(df_raw, DAYS - 300)),
+        revised_first_compared_day=(df_raw, revised(df_raw, DAYS - revisions.REVISED_DAYS)),
+        negative_tests=(df_raw.iloc[:-2], df_negative),
+        new_column=(df_raw.iloc[:-1], df_raw.assign(extra=1)),
+    )
+
+
+@pytest.mark.parametrize('name', list(_cases()))
+def test_incremental_equals_full(name):
+    df_previous_raw, df_new_raw = _cases()[name]
+    previous = data.process_daily_stats(df_previous_raw)
+    incremental = data.process_daily_stats(df_new_raw, previous=previous)
+    full = data.process_daily_stats(df_new_raw)
+    pd.testing.assert_frame_equal(incremental, full, check_exact=True, check_index_type=True)
+
+
+def first_row(df, previous):
+    return revisions.first_changed_row(df, previous, list(df.columns))
+
+
+def test_only_the_tail_is_compared():
+    df_raw = synthetic.daily_stats(DAYS, seed=1)
+    previous = data.process_daily_stats(df_raw.iloc[:-1])
+    assert first_row(df_raw, previous) == DAYS - 1
+    assert first_row(revised(df_raw, DAYS - 5), previous) == DAYS - 5
+    assert first_row(revised(df_raw, DAYS - 300), previous) == 0
@@ -0,0 +1,55 @@
+# Rolling averages (rolling.rolling_stats): any window matches pandas' rolling
+# mean, and incremental updates give the same result as calculating all days
+import pandas as pd
+import pytest
+import data
+import revisions
+import rolling
+import synthetic
+
+DAYS = 1000
+
+
+@pytest.mark.parametrize('window', [1, 2, 3, 4, 7, 14, 30, 365])
+@pytest.mark.parametrize('center', [False, True])
+def test_matches_pandas(window, center):
+    df_daily_stats = data.process_daily_stats(synthetic.daily_stats(500, seed=3))
+    expected = df_daily_stats[['date'] + rolling.AVERAGE_COLUMNS].astype({column: float for column in rolling.AVERAGE_COLUMNS})
+    expected[rolling.AVERAGE_COLUMNS] = expected[rolling.AVERAGE_COLUMNS].rolling(window, center=center).mean()
+    expected = expected.dropna().reset_index(drop=True)
+    pd.testing.assert_frame_equal(rolling.rolling_stats(df_daily_stats, window, center=center), expected)
+
+
+def _revised(df, day, column='cases', delta=10):
+    df = df.copy()
+    df.loc[day, column] += delta
+    return df
+
+
+def _cases():
+    df_raw = synthetic.daily_stats(DAYS, seed=1)
+    return dict(
+        new_day=(df_raw.iloc[:-1], df_raw),
+        new_days=(df_raw.iloc[:-30], df_raw),
+        unchanged=(df_raw, df_raw),
+        fewer_days=(df_raw, df_raw.iloc[:-3]),
+        short_history=(df_raw.iloc[:2], df_raw.iloc[:20]),
+        revised_recent_day=(df_raw, _revised(df_raw, DAYS - 5)),
+        revised_recent_intubated=(df_raw, _revised(df_raw, DAYS - 5, 'intubated')),
+        # Found through the running sums of the last days
+        revised_old_day=(df_raw, _revised(df_raw, DAYS - 300)),
+        revised_first_compared_day=(df_raw, _revised(df_raw, DAYS - revisions.REVISED_DAYS)),
+    )
+
+
+@pytest.mark.parametrize('name', list(_cases()))
+@pytest.mark.parametrize('window', [3, 7, 28])
+@pytest.mark.parametrize('center', [False, True])
+def test_incremental_equals_full(name, window, center):
+    df_previous_raw, df_new_raw = _cases()[name]
+    df_previous = data.process_daily_stats(df_previous_raw)
+    df_new = data.process_daily_stats(df_new_raw)
+    previous = (df_previous, rolling.rolling_stats(df_previous, window, center=center))
+    incremental = rolling.rolling_stats(df_new, window, center=center, previous=previous)
+    full = rolling.rolling_stats(df_new, window, center=center)
+    pd.testing.assert_frame_equal(incremental, full, check_exact=True)
@@ -0,0 +1,65 @@
+import dataclasses
+import numpy as np
+import pandas as pd
+
+
+# Total stats as a dense category x age x gender cube
+# The axes keep the order in which the labels first appear in the total
+# stats, so they match the order of the long total stats table. Missing
+# combinations are 0.
+@dataclasses.dataclass(frozen=True)
+class TotalStatsCube:
+    values: np.ndarray
+    categories: tuple
+    ages: tuple
+    genders: tuple
+
+    # Values of a category as an age x gender array
+    def category(self, cat):
+        return self.values[self.categories.index(cat)]
+
+    # Sum of a category by age (array with one value per age)
+    def by_age(self, cat):
+        return self.category(cat).sum(axis=1)
+
+    # Sum of a category by gender (array with one value per gender)
+    def by_gender(self, cat):
+        return self.category(cat).sum(axis=0)
+
+    # Total of a category
+    def total(self, cat):
+        return self.category(cat).sum()
+
+    # Ratio of two categories in percent (e.g. fatality: deceased / cases)
+    # by: None (age x gender), 'age', 'gender' or 'total'
+    def ratio(self, numerator, denominator, by=None):
+        reduce = {
+            None: lambda cat: self.category(cat),
+            'age': self.by_age,
+            'gender': self.by_gender,
+            'total': self.total
+        }[by]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return reduce(numerator) / reduce(denominator) * 100
+
+    # Fatality (deceased / cases) in percent
+    def fatality(self, by=None):
+        return self.ratio('deceased', 'cases', by=by)
+
+
+# Decode the processed total stats (columns category, age, gender, value) into a cube
+def from_total_stats(df_total_stats):
+    category_codes, categories = pd.factorize(df_total_stats['category'])
+    age_codes, ages = pd.factorize(df_total_stats['age'])
+    gender_codes, genders = pd.factorize(df_total_stats['gender'])
+
+    values = np.zeros((len(categories), len(ages), len(genders)), dtype=df_total_stats['value'].dtype)
+    np.add.at(values, (category_codes, age_codes, gender_codes), df_total_stats['value'].to_numpy())
+    values.flags.writeable = False
+
+    return TotalStatsCube(
+        values=values,
+        categories=tuple(categories),
+        ages=tuple(ages),
+        genders=tuple(genders)
+    )